@@ -0,0 +1,89 @@
+import random
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SAFE_METHODS = ('GET', 'HEAD')
+PIN_COOKIE = 'pin_primary'
+# Always read from primary: processes compare them to invalidate their
+# caches, and replicas lagging behind by different time would make
+# versions go back and forth.
+PRIMARY_MODELS = {'recipes_api.dataversion', 'recipes_api.recipeindexchange',
+                  'authtoken.token'}
+
+state = threading.local()
+
+
+def use_replica() -> bool:
+    """
+    Reads of current request could go to a replica: request is GET or
+    HEAD, it has not written yet and it is not inside transaction on
+    primary, whose reads should see its own writes.
+    """
+    return (getattr(state, 'use_replica', False)
+            and not getattr(state, 'wrote', False)
+            and not connections[DEFAULT_DB_ALIAS].in_atomic_block)
+
+
+class ReplicaRouter:
+    """
+    Sends reads of safe requests to the replica picked for the request
+    by ReplicaMiddleware and everything else to the primary (default)
+    database. Only requests marked by ReplicaMiddleware use replicas:
+    management commands and background jobs always read the primary, and
+    so do reads of PRIMARY_MODELS.
+    """
+
+    def db_for_read(self, model, **hints):
+        replica = getattr(state, 'replica', None)
+        if (replica is not None and use_replica()
+                and model._meta.label_lower not in PRIMARY_MODELS):
+            return replica
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas are copies of the primary, objects are the same rows.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaMiddleware:
+    """
+    Marks GET and HEAD requests as safe to read from replicas and picks
+    a random replica for the request: all its reads see the same state
+    of data, as replicas could lag behind by different time. After a
+    request writes, the client gets a cookie pinning it to the primary
+    for REPLICA_PIN_SECONDS, so it reads its own writes even if replicas
+    lag behind.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state.use_replica = (request.method in SAFE_METHODS
+                             and PIN_COOKIE not in request.COOKIES)
+        state.wrote = False
+        state.replica = (random.choice(settings.REPLICA_DATABASES)
+                         if settings.REPLICA_DATABASES else None)
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = state.wrote
+            state.use_replica = False
+            state.wrote = False
+            state.replica = None
+        if settings.REPLICA_DATABASES and (
+            wrote or request.method not in SAFE_METHODS
+        ):
+            response.set_cookie(PIN_COOKIE, '1',
+                                max_age=settings.REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
@@ -35,6 +35,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'foodgram.db_router.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -74,6 +75,17 @@ DATABASES = {
     }
 }
 
+# Read-only copies of default database, see foodgram.db_router.
+for number, host in enumerate(env.list('POSTGRES_REPLICA_HOSTS',
+                                       default=[]), 1):
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}
+    }
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+# Clients that wrote read from default database for this many seconds.
+REPLICA_PIN_SECONDS = env.int('REPLICA_PIN_SECONDS', default=5)
+DATABASE_ROUTERS = ['foodgram.db_router.ReplicaRouter']
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -107,9 +119,13 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+SHOPPING_LISTS_ROOT = os.path.join(BASE_DIR, 'shopping_lists')
+SHOPPING_LISTS_ACCEL_REDIRECT = env('SHOPPING_LISTS_ACCEL_REDIRECT',
+                                    default=None)
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
@@ -121,6 +137,13 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'recipes_api.paginator.CustomPagination',
 }
 
+FEED_FANOUT_LIMIT = env.int('FEED_FANOUT_LIMIT', default=10000)
+
+TOKEN_CACHE_SIZE = env.int('TOKEN_CACHE_SIZE', default=10000)
+TOKEN_CACHE_TTL = env.float('TOKEN_CACHE_TTL', default=300)
+TOKEN_CACHE_CHECK_INTERVAL = env.float('TOKEN_CACHE_CHECK_INTERVAL',
+                                       default=1)
+
 DJOSER = {
     'HIDE_USERS': False,
     'LOGIN_FIELD': 'email',
@@ -22,11 +22,21 @@ class IngredientAdmin(admin.ModelAdmin):
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'favorites_count',)
+    list_display = ('name', 'author', 'favorites_count',
+                    'shopping_carts_count',)
     list_filter = ('author', 'name', 'tags',)
+    list_select_related = ('author', 'popularity',)
     empty_value_display = '-пусто-'
     inlines = [RecipeIngredientInline, ]
 
+    def favorites_count(self, obj):
+        """Counter of popular recipes, missing until first favorite."""
+        popularity = getattr(obj, 'popularity', None)
+        return popularity.favorites if popularity is not None else 0
+
+    favorites_count.short_description = 'в избранном'
+    favorites_count.admin_order_field = 'popularity__favorites'
+
 
 class FollowAdmin(admin.ModelAdmin):
     list_display = ('user', 'author',)
@@ -0,0 +1,58 @@
+import bisect
+import itertools
+
+from .models import Ingredient
+from .versions import INGREDIENTS, VersionedCache
+
+
+class IngredientIndex:
+    """
+    In-memory index of ingredient catalog for autocomplete. Names are
+    kept casefolded and sorted, so prefix matches are found by binary
+    search, substring matches by a scan over the small catalog.
+    """
+
+    def __init__(self, ingredients):
+        self.entries = sorted(
+            (name.casefold(), name, ingredient_id, measurement_unit)
+            for ingredient_id, name, measurement_unit in ingredients
+        )
+        self.keys = [entry[0] for entry in self.entries]
+
+    def search(self, query: str, limit: int = None) -> list:
+        """
+        :param query - part of ingredient name, case insensitive.
+        :param limit - max number of results, all matches if None.
+        :return: list of ingredient dicts, prefix matches come first.
+        """
+        query = query.strip().casefold()
+        start = bisect.bisect_left(self.keys, query)
+        end = start
+        while end < len(self.keys) and self.keys[end].startswith(query):
+            end += 1
+        substring_matches = (
+            entry for position, entry in enumerate(self.entries)
+            if query in entry[0] and not start <= position < end
+        )
+        result = itertools.islice(
+            itertools.chain(self.entries[start:end], substring_matches),
+            limit
+        )
+        return [
+            {'id': ingredient_id, 'name': name,
+             'measurement_unit': measurement_unit}
+            for _, name, ingredient_id, measurement_unit in result
+        ]
+
+
+def build_ingredient_index() -> IngredientIndex:
+    return IngredientIndex(Ingredient.objects.values_list(
+        'id', 'name', 'measurement_unit'
+    ))
+
+
+ingredient_index = VersionedCache(INGREDIENTS, build_ingredient_index)
+
+
+def search_ingredients(query: str, limit: int = None) -> list:
+    return ingredient_index.get().search(query, limit)
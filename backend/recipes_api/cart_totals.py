@@ -0,0 +1,173 @@
+from collections import defaultdict
+
+from django.db import models
+
+from .counters import ZERO, get_drift
+from .models import (Recipe, RecipeIngredient, ShoppingCart,
+                     ShoppingCartIngredient)
+
+
+def lock_recipes(recipe_ids: list) -> None:
+    """
+    Locks recipe rows till the end of current transaction, in id order.
+    Changes of recipe ingredients and of shopping_carts with the recipe
+    take the lock before reading ingredients, so under READ COMMITTED
+    either the cart change reads new ingredients or the recipe change
+    sees the cart row.
+    """
+    list(Recipe.objects.select_for_update().filter(
+        id__in=recipe_ids
+    ).order_by('id').values_list('id', flat=True))
+
+
+def get_recipes_amounts_queryset(recipe_ids: list) -> models.QuerySet:
+    return RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('ingredient_id').annotate(
+        models.Sum('amount')
+    ).order_by()
+
+
+def get_recipes_amounts(recipe_ids: list) -> dict:
+    """
+    :param recipe_ids
+    :return: summed amounts of recipes ingredients as
+    {ingredient_id: amount}.
+    """
+    return dict(get_recipes_amounts_queryset(recipe_ids))
+
+
+def get_recipe_amounts(recipe_id: int) -> dict:
+    return get_recipes_amounts([recipe_id])
+
+
+def get_amounts_delta(old_amounts: dict, new_amounts: dict) -> dict:
+    """
+    :return: non zero differences new - old as {ingredient_id: delta}.
+    """
+    deltas = {}
+    for ingredient_id in old_amounts.keys() | new_amounts.keys():
+        delta = (new_amounts.get(ingredient_id, 0)
+                 - old_amounts.get(ingredient_id, 0))
+        if delta:
+            deltas[ingredient_id] = delta
+    return deltas
+
+
+def apply_cart_totals_delta(user_ids: list, deltas: dict) -> None:
+    """
+    Adds deltas to shopping_cart totals of given users. Missing rows are
+    inserted with zero amount first and all changes are applied by
+    UPDATE ... SET amount = amount + delta, so concurrent calls do not
+    lose updates. Rows that drop to zero are removed. Should be called
+    inside transaction together with shopping_cart change.
+    :param user_ids - ids of users owners of shopping_cart.
+    :param deltas - {ingredient_id: delta}.
+    """
+    if not user_ids or not deltas:
+        return
+
+    ShoppingCartIngredient.objects.bulk_create(
+        [ShoppingCartIngredient(user_id=user_id, ingredient_id=ingredient_id,
+                                amount=0)
+         for user_id in user_ids
+         for ingredient_id, delta in deltas.items() if delta > 0],
+        ignore_conflicts=True
+    )
+
+    totals = ShoppingCartIngredient.objects.filter(user_id__in=user_ids)
+    totals.filter(ingredient_id__in=deltas).update(
+        amount=models.F('amount') + models.Case(
+            *(models.When(ingredient_id=ingredient_id, then=delta)
+              for ingredient_id, delta in deltas.items()),
+            output_field=models.IntegerField()
+        )
+    )
+    totals.filter(amount__lte=0).delete()
+
+
+def add_recipes_to_cart_totals(user_id: int, recipe_ids: list) -> None:
+    if recipe_ids:
+        lock_recipes(recipe_ids)
+        apply_cart_totals_delta([user_id], get_recipes_amounts(recipe_ids))
+
+
+def remove_recipes_from_cart_totals(user_id: int, recipe_ids: list) -> None:
+    if recipe_ids:
+        lock_recipes(recipe_ids)
+        deltas = {ingredient_id: -amount for ingredient_id, amount
+                  in get_recipes_amounts(recipe_ids).items()}
+        apply_cart_totals_delta([user_id], deltas)
+
+
+def add_recipe_to_cart_totals(user_id: int, recipe_id: int) -> None:
+    add_recipes_to_cart_totals(user_id, [recipe_id])
+
+
+def remove_recipe_from_cart_totals(user_id: int, recipe_id: int) -> None:
+    remove_recipes_from_cart_totals(user_id, [recipe_id])
+
+
+def update_recipe_in_cart_totals(recipe_id: int, deltas: dict) -> None:
+    """
+    Applies change of recipe ingredients to totals of all users who have
+    the recipe in shopping_cart. Recipe should be locked by lock_recipes
+    before its ingredients were read.
+    :param recipe_id
+    :param deltas - {ingredient_id: delta}, see get_amounts_delta.
+    """
+    if not deltas:
+        return
+    user_ids = list(ShoppingCart.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('user_id', flat=True))
+    apply_cart_totals_delta(user_ids, deltas)
+
+
+def get_source_cart_totals() -> models.QuerySet:
+    """
+    Computes shopping_cart totals of all users from shopping_cart and
+    recipe ingredients, the source of truth for ShoppingCartIngredient.
+    :return: queryset of (user_id, ingredient_id, amount) tuples.
+    """
+    return RecipeIngredient.objects.filter(
+        recipe__shopping_carts__isnull=False
+    ).values_list(
+        'recipe__shopping_carts__user_id', 'ingredient_id'
+    ).annotate(models.Sum('amount')).order_by()
+
+
+def get_cart_totals_drift() -> dict:
+    """
+    :return: drifted totals as {(user_id, ingredient_id): (expected,
+    stored)}, see get_drift.
+    """
+    return get_drift(
+        RecipeIngredient.objects.filter(
+            recipe__shopping_carts__isnull=False
+        ).values('recipe__shopping_carts__user_id', 'ingredient_id').annotate(
+            source=models.Sum('amount'), stored=ZERO
+        ).values_list(
+            'recipe__shopping_carts__user_id', 'ingredient_id', 'source',
+            'stored'
+        ).order_by(),
+        ShoppingCartIngredient.objects.annotate(
+            source=ZERO, stored=models.F('amount')
+        ).values_list(
+            'user_id', 'ingredient_id', 'source', 'stored'
+        ).order_by()
+    )
+
+
+def repair_cart_totals(drift: dict) -> None:
+    """
+    Adds drift to totals by apply_cart_totals_delta instead of writing
+    them over, so shopping carts changed since drift was read keep their
+    deltas.
+    :param drift - see get_cart_totals_drift.
+    """
+    deltas_by_user = defaultdict(dict)
+    for (user_id, ingredient_id), (expected, stored) in drift.items():
+        deltas_by_user[user_id][ingredient_id] = expected - stored
+    for user_id, deltas in deltas_by_user.items():
+        apply_cart_totals_delta([user_id], deltas)
@@ -0,0 +1,128 @@
+from collections import defaultdict
+
+from django.db import models
+from django.db.models.functions import Coalesce
+
+from .models import CustomUser, Follow, Recipe, ShoppingCart
+
+# Denormalized counter -> rows it counts:
+# (model, counter field, counted model, foreign key of counted model).
+COUNTERS = (
+    (Recipe, 'shopping_carts_count', ShoppingCart, 'recipe'),
+    (CustomUser, 'recipes_count', Recipe, 'author'),
+    (CustomUser, 'followers_count', Follow, 'author'),
+    (CustomUser, 'following_count', Follow, 'user'),
+)
+ZERO = models.Value(0, output_field=models.IntegerField())
+
+
+def add_to_counter(queryset: models.QuerySet, field: str,
+                   delta: int) -> None:
+    """
+    Changes counter by UPDATE ... SET field = field + delta, so
+    concurrent calls do not lose updates. Should be called inside
+    transaction together with change of counted rows: by signals for
+    saved and deleted models, by views for rows written by
+    recipes_api.relations.
+    """
+    if delta:
+        queryset.update(**{field: models.F(field) + delta})
+
+
+def count_shopping_carts(recipe_ids: list, delta: int) -> None:
+    """
+    :param recipe_ids - recipes added to (delta 1) or removed from
+    (delta -1) shopping cart of one user.
+    """
+    add_to_counter(Recipe.objects.filter(id__in=recipe_ids),
+                   'shopping_carts_count', delta)
+
+
+def count_recipes(author_id: int, delta: int) -> None:
+    add_to_counter(CustomUser.objects.filter(id=author_id),
+                   'recipes_count', delta)
+
+
+def count_follows(user_id: int, author_ids: list, delta: int) -> None:
+    """
+    :param user_id - follower.
+    :param author_ids - authors followed (delta 1) or unfollowed
+    (delta -1) by user.
+    """
+    add_to_counter(CustomUser.objects.filter(id=user_id),
+                   'following_count', delta * len(author_ids))
+    add_to_counter(CustomUser.objects.filter(id__in=author_ids),
+                   'followers_count', delta)
+
+
+def get_source_count(counted_model, foreign_key: str) -> Coalesce:
+    """:return: correlated subquery counting rows of outer object."""
+    return Coalesce(models.Subquery(
+        counted_model.objects.filter(
+            **{foreign_key: models.OuterRef('pk')}
+        ).order_by().values(foreign_key).annotate(
+            count=models.Count('*')
+        ).values('count'),
+        output_field=models.IntegerField()
+    ), 0)
+
+
+def get_drift(source: models.QuerySet, stored: models.QuerySet) -> dict:
+    """
+    Compares counts computed from counted rows with stored counters. Both
+    are read by one UNION ALL query, i.e. from one snapshot, so a
+    concurrent change that commits rows together with F() update of their
+    counter is seen on both sides or on neither.
+    :param source - values_list of key fields, count and ZERO.
+    :param stored - values_list of the same key fields, ZERO and counter.
+    :return: {key tuple: (expected, stored)} for differing keys only.
+    """
+    counts = defaultdict(lambda: [0, 0])
+    for *key, expected, actual in source.union(stored, all=True).iterator():
+        counts[tuple(key)][0] += expected
+        counts[tuple(key)][1] += actual
+    return {key: (expected, actual)
+            for key, (expected, actual) in counts.items()
+            if expected != actual}
+
+
+def add_to_counters(queryset: models.QuerySet, field: str, deltas: dict,
+                    key: str = 'pk') -> None:
+    """
+    Adds different deltas to counters, one add_to_counter per distinct
+    delta. Repairs drift without overwriting counters, so increments
+    made concurrently since drift was read are kept.
+    :param deltas - {key value: delta}.
+    :param key - field deltas are keyed by.
+    """
+    keys_by_delta = defaultdict(list)
+    for key_value, delta in deltas.items():
+        keys_by_delta[delta].append(key_value)
+    for delta, key_values in keys_by_delta.items():
+        add_to_counter(queryset.filter(**{f'{key}__in': key_values}),
+                       field, delta)
+
+
+def repair_counters(verify: bool = False) -> dict:
+    """
+    Recomputes every counter from counted rows and adds the difference
+    to drifted counters. Counted rows and counter are read by one query
+    per counter and fixed by delta, so it is safe to run while counters
+    are being changed.
+    :param verify - only count drifted rows.
+    :return: number of drifted rows as {(model name, field): count}.
+    """
+    drifted = {}
+    for model, field, counted_model, foreign_key in COUNTERS:
+        deltas = {
+            pk: source_count - count
+            for pk, source_count, count in model.objects.annotate(
+                source_count=get_source_count(counted_model, foreign_key)
+            ).exclude(**{field: models.F('source_count')}).values_list(
+                'pk', 'source_count', field
+            ).order_by()
+        }
+        drifted[(model.__name__, field)] = len(deltas)
+        if not verify:
+            add_to_counters(model.objects.all(), field, deltas)
+    return drifted
@@ -0,0 +1,77 @@
+import csv
+import itertools
+import json
+
+from django.http import StreamingHttpResponse
+from rest_framework import status
+from rest_framework.response import Response
+
+from .pdf import create_pdffile_response, get_shop_ingredients
+
+
+class Echo:
+    """Pseudo buffer for csv.writer that returns written line."""
+
+    def write(self, value):
+        return value
+
+
+def generate_txt(buying_list):
+    yield 'СПИСОК ИНГРЕДИЕНТОВ К ПОКУПКЕ:\n\n'
+    for count, item in enumerate(buying_list, start=1):
+        yield f"{count}. {item['name']} - {item['amount']} {item['unit']}\n"
+
+
+def generate_csv(buying_list):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'amount', 'measurement_unit'))
+    for item in buying_list:
+        yield writer.writerow((item['name'], item['amount'], item['unit']))
+
+
+def generate_json(buying_list):
+    yield '['
+    for count, item in enumerate(buying_list):
+        separator = ',' if count else ''
+        yield separator + json.dumps({
+            'name': item['name'],
+            'amount': item['amount'],
+            'measurement_unit': item['unit'],
+        }, ensure_ascii=False)
+    yield ']'
+
+
+EXPORTS = {
+    'txt': (generate_txt, 'text/plain; charset=utf-8'),
+    'csv': (generate_csv, 'text/csv; charset=utf-8'),
+    'json': (generate_json, 'application/json'),
+}
+
+
+def create_shopping_list_response(request, export_format: str) -> object:
+    """
+    Returns buying list of request user in given format. Pdf is delegated
+    to create_pdffile_response, other formats are streamed row by row from
+    the aggregation query without building the document in memory.
+    :param request
+    :param export_format - one of pdf, txt, csv or json.
+    :return: Response object
+    """
+    if export_format not in EXPORTS:
+        return create_pdffile_response(request)
+
+    buying_list = get_shop_ingredients(request.user.id).iterator()
+    first_item = next(buying_list, None)
+    if first_item is None:
+        error_text = 'No shopping cart or something wrong with other data.'
+        return Response(error_text, status=status.HTTP_400_BAD_REQUEST)
+
+    generate, content_type = EXPORTS[export_format]
+    response = StreamingHttpResponse(
+        generate(itertools.chain([first_item], buying_list)),
+        content_type=content_type
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="buying_list.{export_format}"'
+    )
+    return response
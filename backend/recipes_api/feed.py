@@ -0,0 +1,80 @@
+from django.conf import settings
+
+from .models import CustomUser, Follow, Recipe, TimelineEntry
+
+
+def fan_out_recipe(recipe: Recipe) -> None:
+    """
+    Writes new recipe to feeds of all author followers. Authors with more
+    than FEED_FANOUT_LIMIT followers are switched to fan-out on read:
+    their recipes are merged into feeds when feeds are read.
+    :param recipe - just created recipe.
+    """
+    author = recipe.author
+    if author.fan_out_on_read:
+        return
+
+    follower_ids = list(Follow.objects.filter(author=author).values_list(
+        'user_id', flat=True
+    )[:settings.FEED_FANOUT_LIMIT + 1])
+    if len(follower_ids) > settings.FEED_FANOUT_LIMIT:
+        CustomUser.objects.filter(pk=author.pk).update(fan_out_on_read=True)
+        author.fan_out_on_read = True
+        return
+
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, recipe=recipe, author=author)
+         for user_id in follower_ids),
+        batch_size=1000,
+        ignore_conflicts=True
+    )
+
+
+def backfill_timeline(user_id: int, author_ids: list) -> None:
+    """Writes existing recipes of just followed authors to user feed."""
+    recipes = Recipe.objects.filter(
+        author_id__in=author_ids, author__fan_out_on_read=False
+    ).values_list('id', 'author_id')
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, recipe_id=recipe_id,
+                       author_id=author_id)
+         for recipe_id, author_id in recipes.iterator()),
+        batch_size=1000,
+        ignore_conflicts=True
+    )
+
+
+def remove_from_timeline(user_id: int, author_ids: list) -> None:
+    """Removes recipes of unfollowed authors from user feed."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, author_id__in=author_ids
+    ).delete()
+
+
+def get_feed_recipe_ids(user, before: int = None, count: int = 10) -> list:
+    """
+    Returns ids of latest recipes from feed of user: one range scan of
+    timeline merged with recipes of followed fan-out on read authors.
+    :param user - owner of feed.
+    :param before - return only recipes with id less than it.
+    :param count - max number of ids.
+    :return: recipe ids in descending order.
+    """
+    entries = TimelineEntry.objects.filter(user=user)
+    if before is not None:
+        entries = entries.filter(recipe_id__lt=before)
+    recipe_ids = set(entries.order_by('-recipe_id').values_list(
+        'recipe_id', flat=True
+    )[:count])
+
+    popular_author_ids = list(Follow.objects.filter(
+        user=user, author__fan_out_on_read=True
+    ).values_list('author_id', flat=True))
+    if popular_author_ids:
+        recipes = Recipe.objects.filter(author_id__in=popular_author_ids)
+        if before is not None:
+            recipes = recipes.filter(id__lt=before)
+        recipe_ids.update(recipes.order_by('-id').values_list(
+            'id', flat=True
+        )[:count])
+    return sorted(recipe_ids, reverse=True)[:count]
@@ -1,12 +1,15 @@
+from django.db import models
 from django_filters import rest_framework as filters
-from rest_framework import status
-from rest_framework.response import Response
 
-from .models import Ingredient, Recipe, Tag
+from .models import Ingredient, Recipe
 
 
 class RecipeFilter(filters.FilterSet):
     tags = filters.CharFilter(method='filter_tags')
+    tags_mode = filters.ChoiceFilter(
+        choices=(('any', 'any'), ('all', 'all')),
+        method='filter_tags_mode'
+    )
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
@@ -21,7 +24,7 @@ class RecipeFilter(filters.FilterSet):
         if user.is_anonymous:
             return Recipe.objects.none()
         if value:
-            return queryset.filter(favorites__user=user)
+            return queryset.filter(is_favorited=True)
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
@@ -29,21 +32,38 @@ class RecipeFilter(filters.FilterSet):
         if user.is_anonymous:
             return Recipe.objects.none()
         if value:
-            return queryset.filter(shopping_carts__user=user)
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset
 
-    def filter_tags(self, queryset, name, value):
-        try:
-            tags_list = self.request.query_params.getlist('tags')
-        except AttributeError:
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-
-        tags = Tag.objects.filter(slug__in=tags_list).values_list('id',
-                                                                  flat=True)
-        if tags is not None:
-            return queryset.filter(tags__id__in=tags).distinct()
+    def filter_tags_mode(self, queryset, name, value):
+        """Mode is applied by filter_tags."""
         return queryset
 
+    def filter_tags(self, queryset, name, value):
+        """
+        Filters recipes by tag slugs with EXISTS subqueries on recipe-tag
+        table, so no join and DISTINCT are needed. With tags_mode=all
+        recipe should have every given tag, by default any of them.
+        """
+        slugs = set(self.data.getlist('tags'))
+        recipe_tags = Recipe.tags.through.objects.filter(
+            recipe=models.OuterRef('pk')
+        )
+        if self.data.get('tags_mode') == 'all':
+            conditions = {
+                f'has_tag_{number}': models.Exists(
+                    recipe_tags.filter(tag__slug=slug)
+                )
+                for number, slug in enumerate(sorted(slugs))
+            }
+        else:
+            conditions = {'has_tags': models.Exists(
+                recipe_tags.filter(tag__slug__in=slugs)
+            )}
+        return queryset.annotate(**conditions).filter(
+            **{condition: True for condition in conditions}
+        )
+
 
 class IngredientFilter(filters.FilterSet):
     name = filters.CharFilter(lookup_expr='contains')
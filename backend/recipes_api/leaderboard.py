@@ -0,0 +1,221 @@
+import datetime
+from collections import defaultdict
+
+from django.db import models, transaction
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .counters import ZERO, add_to_counters, get_drift
+from .models import DataVersion, Favorite, FavoritesBucket, RecipePopularity
+from .versions import FAVORITES_WEEK, get_version
+
+WEEK_DAYS = 7
+ALL_TIME = 'all'
+WEEK = 'week'
+PERIOD_FIELDS = {ALL_TIME: 'favorites', WEEK: 'favorites_week'}
+
+
+def get_week_start(today: datetime.date = None) -> datetime.date:
+    """:return: first day of rolling week ending today."""
+    today = today or timezone.localdate()
+    return today - datetime.timedelta(days=WEEK_DAYS - 1)
+
+
+def get_day_start(day: datetime.date) -> datetime.datetime:
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time()))
+
+
+def expire_week_counters(today: datetime.date = None) -> datetime.date:
+    """
+    Moves rolling week of counters to today: favorites added in days that
+    left the week are subtracted from week counters and their buckets are
+    dropped. Done by the first call of a day, other calls cost one lookup.
+    :param today - current date, for tests and rebuild.
+    :return: first day of current week.
+    """
+    week_start = get_week_start(today)
+    if get_version(FAVORITES_WEEK) >= week_start.toordinal():
+        return week_start
+
+    with transaction.atomic():
+        DataVersion.objects.bulk_create([DataVersion(key=FAVORITES_WEEK)],
+                                        ignore_conflicts=True)
+        state = DataVersion.objects.select_for_update().get(
+            key=FAVORITES_WEEK
+        )
+        if state.version >= week_start.toordinal():
+            return week_start
+
+        expired = FavoritesBucket.objects.filter(day__lt=week_start)
+        expired_count = expired.filter(
+            recipe_id=models.OuterRef('recipe_id')
+        ).order_by().values('recipe_id').annotate(
+            total=models.Sum('count')
+        ).values('total')
+        RecipePopularity.objects.filter(
+            recipe_id__in=expired.values('recipe_id')
+        ).update(favorites_week=models.F('favorites_week') - Coalesce(
+            models.Subquery(expired_count), 0
+        ))
+        expired.delete()
+        state.version = week_start.toordinal()
+        state.save(update_fields=['version'])
+    return week_start
+
+
+def add_favorites_to_leaderboard(recipe_ids: list,
+                                 created: datetime.datetime = None) -> None:
+    """
+    Counts recipes added to favorites. Missing rows are inserted with
+    zero counters first and counters are incremented by UPDATE, so
+    concurrent calls do not lose updates. Should be called inside
+    transaction together with favorites change.
+    :param recipe_ids - ids of recipes added to favorites of one user.
+    :param created - time favorites were added, now if None.
+    """
+    if not recipe_ids:
+        return
+
+    expire_week_counters()
+    day = timezone.localdate(created)
+    RecipePopularity.objects.bulk_create(
+        [RecipePopularity(recipe_id=recipe_id) for recipe_id in recipe_ids],
+        ignore_conflicts=True
+    )
+    RecipePopularity.objects.filter(recipe_id__in=recipe_ids).update(
+        favorites=models.F('favorites') + 1,
+        favorites_week=models.F('favorites_week') + 1
+    )
+    FavoritesBucket.objects.bulk_create(
+        [FavoritesBucket(recipe_id=recipe_id, day=day)
+         for recipe_id in recipe_ids],
+        ignore_conflicts=True
+    )
+    FavoritesBucket.objects.filter(recipe_id__in=recipe_ids, day=day).update(
+        count=models.F('count') + 1
+    )
+
+
+def remove_favorites_from_leaderboard(rows: list) -> None:
+    """
+    Uncounts deleted favorites: all-time counters always, week counters
+    and buckets only if favorite was added this week. Should be called
+    inside transaction that deleted favorites.
+    :param rows - (recipe_id, created) of deleted favorites of one user.
+    """
+    if not rows:
+        return
+
+    week_start = expire_week_counters()
+    days = defaultdict(list)
+    for recipe_id, created in rows:
+        days[timezone.localdate(created)].append(recipe_id)
+    RecipePopularity.objects.filter(
+        recipe_id__in=[recipe_id for recipe_id, _ in rows]
+    ).update(favorites=models.F('favorites') - 1)
+    week_ids = []
+    for day, recipe_ids in days.items():
+        if day < week_start:
+            continue
+        week_ids.extend(recipe_ids)
+        FavoritesBucket.objects.filter(
+            recipe_id__in=recipe_ids, day=day
+        ).update(count=models.F('count') - 1)
+    RecipePopularity.objects.filter(recipe_id__in=week_ids).update(
+        favorites_week=models.F('favorites_week') - 1
+    )
+
+
+def get_popular_recipes(period: str = WEEK,
+                        count: int = 10) -> models.QuerySet:
+    """
+    Top of recipes by number of users who added them to favorites, read
+    from precomputed counters by index on (counter, recipe).
+    :param period - WEEK for rolling week or ALL_TIME.
+    :param count - size of the top.
+    :return: RecipePopularity rows with recipes, most popular first.
+    """
+    if period == WEEK:
+        expire_week_counters()
+    field = PERIOD_FIELDS[period]
+    return RecipePopularity.objects.filter(
+        **{f'{field}__gt': 0}
+    ).select_related('recipe').order_by(f'-{field}', '-recipe_id')[:count]
+
+
+def get_popularity_drift(week_start: datetime.date) -> dict:
+    """
+    :return: drifted counters as {field: {recipe_id: (expected,
+    stored)}} for favorites and favorites_week, see get_drift.
+    """
+    stored = RecipePopularity.objects.order_by()
+    week_favorites = models.Q(created__gte=get_day_start(week_start))
+    return {
+        field: {
+            recipe_id: counts for (recipe_id,), counts in get_drift(
+                Favorite.objects.values('recipe_id').annotate(
+                    source=models.Count('id', filter=source_filter),
+                    stored=ZERO
+                ).values_list('recipe_id', 'source', 'stored').order_by(),
+                stored.annotate(
+                    source=ZERO, stored=models.F(field)
+                ).values_list('recipe_id', 'source', 'stored')
+            ).items()
+        }
+        for field, source_filter in (('favorites', None),
+                                     ('favorites_week', week_favorites))
+    }
+
+
+def get_buckets_drift(week_start: datetime.date) -> dict:
+    """
+    :return: drifted buckets as {(recipe_id, day): (expected, stored)},
+    see get_drift.
+    """
+    return get_drift(
+        Favorite.objects.filter(
+            created__gte=get_day_start(week_start)
+        ).annotate(day=TruncDate('created')).values(
+            'recipe_id', 'day'
+        ).annotate(source=models.Count('id'), stored=ZERO).values_list(
+            'recipe_id', 'day', 'source', 'stored'
+        ).order_by(),
+        FavoritesBucket.objects.annotate(
+            source=ZERO, stored=models.F('count')
+        ).values_list('recipe_id', 'day', 'source', 'stored').order_by()
+    )
+
+
+def repair_leaderboard(popularity_drift: dict, buckets_drift: dict) -> None:
+    """
+    Adds drift to counters and buckets instead of writing them over, so
+    favorites changed since drift was read keep their increments.
+    Should be called in transaction that locked FAVORITES_WEEK version
+    before drift was read, otherwise week could expire in between.
+    :param popularity_drift - see get_popularity_drift.
+    :param buckets_drift - see get_buckets_drift.
+    """
+    RecipePopularity.objects.bulk_create(
+        [RecipePopularity(recipe_id=recipe_id) for recipe_id
+         in set().union(*popularity_drift.values())],
+        ignore_conflicts=True
+    )
+    for field, drift in popularity_drift.items():
+        add_to_counters(
+            RecipePopularity.objects.all(), field,
+            {recipe_id: expected - stored
+             for recipe_id, (expected, stored) in drift.items()},
+            key='recipe_id'
+        )
+
+    FavoritesBucket.objects.bulk_create(
+        [FavoritesBucket(recipe_id=recipe_id, day=day)
+         for recipe_id, day in buckets_drift],
+        ignore_conflicts=True
+    )
+    deltas_by_day = defaultdict(dict)
+    for (recipe_id, day), (expected, stored) in buckets_drift.items():
+        deltas_by_day[day][recipe_id] = expected - stored
+    for day, deltas in deltas_by_day.items():
+        add_to_counters(FavoritesBucket.objects.filter(day=day), 'count',
+                        deltas, key='recipe_id')
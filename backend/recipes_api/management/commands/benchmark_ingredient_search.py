@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes_api.autocomplete import build_ingredient_index
+from recipes_api.models import Ingredient
+from recipes_api.serializers import IngredientSerializer
+
+
+class Command(BaseCommand):
+    help = ('Compares ingredient autocomplete index with name__contains '
+            'query on current ingredient catalog.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('queries', nargs='*',
+                            default=['а', 'мо', 'сол', 'масло', 'сыр'])
+        parser.add_argument('--repeat', type=int, default=100)
+        parser.add_argument('--limit', type=int, default=None)
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        started = time.perf_counter()
+        index = build_ingredient_index()
+        build_time = time.perf_counter() - started
+        self.stdout.write(
+            f'index of {len(index.keys)} ingredients built in '
+            f'{build_time * 1000:.1f} ms'
+        )
+        for query in options['queries']:
+            started = time.perf_counter()
+            for _ in range(repeat):
+                queryset = Ingredient.objects.filter(name__contains=query)
+                query_result = IngredientSerializer(queryset, many=True).data
+            query_time = (time.perf_counter() - started) / repeat
+
+            started = time.perf_counter()
+            for _ in range(repeat):
+                index_result = index.search(query, options['limit'])
+            index_time = (time.perf_counter() - started) / repeat
+
+            self.stdout.write(
+                f'{query!r:>10}: contains {query_time * 1000:7.2f} ms '
+                f'({len(query_result)} rows), index '
+                f'{index_time * 1000:7.3f} ms ({len(index_result)} rows)'
+            )
@@ -0,0 +1,41 @@
+import tempfile
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from recipes_api.pdf import register_font, render_pdf
+
+
+class Command(BaseCommand):
+    help = 'Measures time and peak memory of shopping list pdf rendering.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('sizes', nargs='*', type=int,
+                            default=[10, 100, 5000],
+                            help='Numbers of lines in buying list.')
+
+    def handle(self, *args, **options):
+        register_font()
+        for size in options['sizes']:
+            buying_list = [
+                {'name': f'ингредиент {number}', 'amount': number,
+                 'unit': 'г'}
+                for number in range(1, size + 1)
+            ]
+            with tempfile.TemporaryFile() as file:
+                started = time.perf_counter()
+                render_pdf(buying_list, file)
+                elapsed = time.perf_counter() - started
+                file_size = file.tell()
+            # tracemalloc slows rendering down, so memory is measured
+            # in a separate run.
+            with tempfile.TemporaryFile() as file:
+                tracemalloc.start()
+                render_pdf(buying_list, file)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            self.stdout.write(
+                f'{size:>6} lines: {elapsed * 1000:8.1f} ms, '
+                f'peak {peak / 1024:8.1f} KiB, file {file_size / 1024:.1f} KiB'
+            )
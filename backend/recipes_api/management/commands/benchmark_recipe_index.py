@@ -0,0 +1,112 @@
+import itertools
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from recipes_api.models import RecipeIngredient
+from recipes_api.recipe_index import RecipeIngredientIndex, build_recipe_index
+
+
+class Command(BaseCommand):
+    help = ('Measures "what can I cook" index on synthetic catalogs of '
+            'given sizes and compares it with aggregation query on '
+            'current recipes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('sizes', nargs='*', type=int,
+                            default=[10000, 1000000],
+                            help='Numbers of recipes in synthetic catalogs.')
+        parser.add_argument('--ingredients', type=int, default=2000,
+                            help='Size of synthetic ingredient catalog.')
+        parser.add_argument('--per-recipe', type=int, default=8)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--count', type=int, default=10,
+                            help='Number of recipes to find.')
+
+    def handle(self, *args, **options):
+        self.options = options
+        for size in options['sizes']:
+            self.benchmark_synthetic(size)
+        if RecipeIngredient.objects.exists():
+            self.benchmark_database()
+
+    def generate_pairs(self, size):
+        """Ingredient popularity follows Zipf law, like salt vs saffron."""
+        generator = random.Random(size)
+        ingredients = range(1, self.options['ingredients'] + 1)
+        weights = list(itertools.accumulate(
+            1 / ingredient_id for ingredient_id in ingredients
+        ))
+        for recipe_id in range(1, size + 1):
+            for ingredient_id in generator.choices(
+                ingredients, cum_weights=weights, k=self.options['per_recipe']
+            ):
+                yield ingredient_id, recipe_id
+
+    def measure(self, function):
+        started = time.perf_counter()
+        for _ in range(self.options['repeat']):
+            result = function()
+        return (time.perf_counter() - started) / self.options['repeat'], result
+
+    def write_queries(self, index, queries):
+        count = self.options['count']
+        for label, ingredient_ids, min_matches in queries:
+            elapsed, result = self.measure(
+                lambda: index.search(ingredient_ids, min_matches, count)
+            )
+            self.stdout.write(
+                f'  {label:<28} {elapsed * 1000:8.3f} ms '
+                f'({len(result)} recipes)'
+            )
+
+    def benchmark_synthetic(self, size):
+        started = time.perf_counter()
+        index = RecipeIngredientIndex(self.generate_pairs(size))
+        build_time = time.perf_counter() - started
+        self.stdout.write(
+            f'{size} recipes: built in {build_time:.1f} s, postings '
+            f'{index.postings_size / 2 ** 20:.1f} MiB'
+        )
+        self.write_queries(index, [
+            ('all of 3 common', [1, 2, 3], 3),
+            ('all of 2 rare', [1500, 1700], 2),
+            ('most of 5 mixed', [1, 7, 40, 300, 1200], 1),
+            ('most of 15 pantry', range(1, 16), 1),
+        ])
+
+        generator = random.Random(0)
+        started = time.perf_counter()
+        for recipe_id in range(size + 1, size + 101):
+            index.set_recipe(recipe_id, generator.sample(range(1, 200), 8))
+        update_time = (time.perf_counter() - started) / 100
+        self.stdout.write(
+            f'  {"incremental recipe update":<28} {update_time * 1000:8.3f} ms'
+        )
+
+    def benchmark_database(self):
+        count = self.options['count']
+        index = build_recipe_index()
+        popular_ids = list(RecipeIngredient.objects.order_by().values(
+            'ingredient_id'
+        ).annotate(recipes=Count('id')).order_by('-recipes').values_list(
+            'ingredient_id', flat=True
+        )[:5])
+        self.stdout.write(
+            f'current recipes ({index.recipes_count}), '
+            f'{len(popular_ids)} most used ingredients:'
+        )
+        self.write_queries(index, [('index, most of', popular_ids, 1)])
+        elapsed, result = self.measure(lambda: list(
+            RecipeIngredient.objects.filter(
+                ingredient_id__in=popular_ids
+            ).order_by().values('recipe_id').annotate(
+                matched=Count('id')
+            ).order_by('-matched', '-recipe_id')[:count]
+        ))
+        self.stdout.write(
+            f'  {"aggregation query, most of":<28} {elapsed * 1000:8.3f} ms '
+            f'({len(result)} recipes)'
+        )
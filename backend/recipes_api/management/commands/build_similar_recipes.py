@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes_api.recipe_index import prune_recipe_changes
+from recipes_api.similar import MAX_DF, update_similar_recipes
+
+
+class Command(BaseCommand):
+    help = ('Computes similar recipes by ingredients. First run (or run '
+            'with --full) computes neighbours of all recipes, next runs '
+            'recompute only recipes affected by changes since last run. '
+            'Then deletes old entries of log of recipe changes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=10,
+                            help='Number of similar recipes per recipe.')
+        parser.add_argument('--full', action='store_true',
+                            help='Recompute neighbours of all recipes.')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--max-df', type=int, default=MAX_DF,
+                            help='Number of recipes making ingredient too '
+                                 'common to look for neighbours by it.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        recipes_count, saved = update_similar_recipes(
+            options['count'], options['full'], options['batch_size'],
+            options['max_df']
+        )
+        elapsed = time.perf_counter() - started
+        pruned = prune_recipe_changes()
+        self.stdout.write(self.style.SUCCESS(
+            f'Similar recipes updated for {recipes_count} recipes: '
+            f'{saved} neighbours stored in {elapsed:.1f} s, {pruned} old '
+            f'log entries deleted.'
+        ))
@@ -0,0 +1,85 @@
+import csv
+import itertools
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes_api.models import Ingredient
+from recipes_api.versions import INGREDIENTS, bump_version
+
+
+def normalize(value: str) -> str:
+    return ' '.join(value.split()).lower()
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield row[0], row[1]
+
+
+def read_json(file):
+    for item in json.load(file):
+        yield item['title'], item['dimension']
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
+
+
+class Command(BaseCommand):
+    help = ('Loads ingredient catalog from csv (name,unit) or json '
+            '([{"title", "dimension"}]) file. Already existing ingredients '
+            'are skipped, so the command can be re-run safely.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to ingredients file.')
+        parser.add_argument('--format', choices=READERS.keys(),
+                            help='File format, guessed by extension if '
+                                 'omitted.')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = (options['format']
+                       or os.path.splitext(path)[1].lstrip('.').lower())
+        if file_format not in READERS:
+            raise CommandError(f'Unknown ingredients file format: {path}')
+
+        existing = set(Ingredient.objects.values_list(
+            'name', 'measurement_unit'
+        ))
+        count_before = len(existing)
+        total = 0
+        with open(path, encoding='utf-8') as file, transaction.atomic():
+            ingredients = (
+                (normalize(name), normalize(unit))
+                for name, unit in READERS[file_format](file)
+            )
+            while True:
+                batch = list(itertools.islice(ingredients,
+                                              options['batch_size']))
+                if not batch:
+                    break
+                total += len(batch)
+                new_ingredients = []
+                for name, unit in batch:
+                    if name and unit and (name, unit) not in existing:
+                        existing.add((name, unit))
+                        new_ingredients.append(
+                            Ingredient(name=name, measurement_unit=unit)
+                        )
+                Ingredient.objects.bulk_create(new_ingredients,
+                                               ignore_conflicts=True)
+            inserted = Ingredient.objects.count() - count_before
+            if inserted:
+                bump_version(INGREDIENTS)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Ingredients loaded: {inserted} inserted, '
+            f'{total - inserted} skipped.'
+        ))
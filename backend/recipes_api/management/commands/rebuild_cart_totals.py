@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes_api.cart_totals import get_cart_totals_drift, repair_cart_totals
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds materialized shopping cart totals from shopping carts '
+            'and recipe ingredients or verifies them with --verify. Only '
+            'drifted totals are changed, by delta, so it is safe to run '
+            'while shopping carts change.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Only compare totals with source data.')
+
+    def handle(self, *args, **options):
+        drift = get_cart_totals_drift()
+        for (user_id, ingredient_id), (source, total) in sorted(
+            drift.items()
+        ):
+            self.stdout.write(
+                f'user {user_id}, ingredient {ingredient_id}: '
+                f'expected {source}, stored {total}'
+            )
+        if options['verify']:
+            if drift:
+                raise CommandError(
+                    f'{len(drift)} shopping cart totals differ from source.'
+                )
+            self.stdout.write(self.style.SUCCESS(
+                'Shopping cart totals are consistent.'
+            ))
+            return
+
+        with transaction.atomic():
+            repair_cart_totals(drift)
+        self.stdout.write(self.style.SUCCESS(
+            f'Shopping cart totals rebuilt: {len(drift)} rows drifted.'
+        ))
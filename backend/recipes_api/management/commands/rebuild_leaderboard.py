@@ -0,0 +1,65 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes_api.leaderboard import (expire_week_counters, get_buckets_drift,
+                                     get_popularity_drift, repair_leaderboard)
+from recipes_api.models import DataVersion
+from recipes_api.versions import FAVORITES_WEEK
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds popular recipes counters from favorites or verifies '
+            'them with --verify. Only drifted counters are changed, by '
+            'delta, so it is safe to run while favorites change.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Only compare counters with source data.')
+
+    def write_drift(self, popularity_drift, buckets_drift):
+        for field, drift in popularity_drift.items():
+            for recipe_id, (expected, stored) in sorted(drift.items()):
+                self.stdout.write(
+                    f'recipe {recipe_id}: {field} expected {expected}, '
+                    f'stored {stored}'
+                )
+        for (recipe_id, day), (expected, stored) in sorted(
+            buckets_drift.items()
+        ):
+            self.stdout.write(
+                f'recipe {recipe_id}: {day} bucket expected {expected}, '
+                f'stored {stored}'
+            )
+        return (len(set().union(*popularity_drift.values())),
+                len(buckets_drift))
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            expire_week_counters()
+            # Holds off expiration of week counters till drift is added.
+            state = DataVersion.objects.select_for_update().get(
+                key=FAVORITES_WEEK
+            )
+            week_start = datetime.date.fromordinal(state.version)
+            popularity_drift = get_popularity_drift(week_start)
+            buckets_drift = get_buckets_drift(week_start)
+            recipes, buckets = self.write_drift(popularity_drift,
+                                                buckets_drift)
+            if options['verify']:
+                if recipes or buckets:
+                    raise CommandError(
+                        f'{recipes} popular recipes counters and {buckets} '
+                        f'day buckets differ from source.'
+                    )
+                self.stdout.write(self.style.SUCCESS(
+                    'Popular recipes counters are consistent.'
+                ))
+                return
+            repair_leaderboard(popularity_drift, buckets_drift)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Popular recipes counters rebuilt: {recipes} recipes and '
+            f'{buckets} day buckets drifted.'
+        ))
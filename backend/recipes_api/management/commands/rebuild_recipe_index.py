@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes_api.recipe_index import build_recipe_index, reset_recipe_index
+
+
+class Command(BaseCommand):
+    help = ('Makes every worker rebuild its index of recipe ingredients '
+            'and clears log of recipe changes applied to it.')
+
+    def handle(self, *args, **options):
+        reset_recipe_index()
+        started = time.perf_counter()
+        index = build_recipe_index()
+        build_time = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Recipe index reset: {index.recipes_count} recipes, '
+            f'{len(index.postings)} ingredients, posting lists take '
+            f'{index.postings_size / 2 ** 20:.1f} MiB, built in '
+            f'{build_time * 1000:.0f} ms.'
+        ))
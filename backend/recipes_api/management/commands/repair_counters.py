@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes_api.counters import repair_counters
+
+
+class Command(BaseCommand):
+    help = ('Recomputes denormalized counters of recipes and users from '
+            'favorites, shopping carts, recipes and follows or verifies '
+            'them with --verify.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Only compare counters with source data.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drifted = repair_counters(verify=options['verify'])
+        for (model_name, field), count in drifted.items():
+            self.stdout.write(f'{model_name}.{field}: {count} drifted')
+        total = sum(drifted.values())
+        if options['verify']:
+            if total:
+                raise CommandError(
+                    f'{total} counters differ from source.'
+                )
+            self.stdout.write(self.style.SUCCESS('Counters are consistent.'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Counters repaired: {total} rows updated.'
+        ))
@@ -0,0 +1,95 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Postgres: generated tsvector column with GIN index, kept up to date by
+# database itself.
+POSTGRES_SQL = [
+    "ALTER TABLE recipes_api_recipe ADD COLUMN IF NOT EXISTS search_vector "
+    "tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('russian', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(text, '')), 'B')"
+    ") STORED",
+    "CREATE INDEX IF NOT EXISTS recipe_search_vector_idx "
+    "ON recipes_api_recipe USING GIN (search_vector)",
+]
+POSTGRES_REVERSE_SQL = [
+    "ALTER TABLE recipes_api_recipe DROP COLUMN IF EXISTS search_vector",
+]
+
+# SQLite: external content FTS5 table synced by triggers, matches in name
+# weigh more than matches in text.
+SQLITE_SQL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS recipes_api_recipe_fts USING fts5("
+    "name, text, content='recipes_api_recipe', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "INSERT INTO recipes_api_recipe_fts(recipes_api_recipe_fts, rank) "
+    "VALUES ('rank', 'bm25(10.0, 1.0)')",
+    "CREATE TRIGGER IF NOT EXISTS recipes_api_recipe_fts_ai "
+    "AFTER INSERT ON recipes_api_recipe BEGIN "
+    "INSERT INTO recipes_api_recipe_fts(rowid, name, text) "
+    "VALUES (new.id, new.name, new.text); END",
+    "CREATE TRIGGER IF NOT EXISTS recipes_api_recipe_fts_ad "
+    "AFTER DELETE ON recipes_api_recipe BEGIN "
+    "INSERT INTO recipes_api_recipe_fts(recipes_api_recipe_fts, rowid, "
+    "name, text) VALUES ('delete', old.id, old.name, old.text); END",
+    "CREATE TRIGGER IF NOT EXISTS recipes_api_recipe_fts_au "
+    "AFTER UPDATE OF name, text ON recipes_api_recipe BEGIN "
+    "INSERT INTO recipes_api_recipe_fts(recipes_api_recipe_fts, rowid, "
+    "name, text) VALUES ('delete', old.id, old.name, old.text); "
+    "INSERT INTO recipes_api_recipe_fts(rowid, name, text) "
+    "VALUES (new.id, new.name, new.text); END",
+    "INSERT INTO recipes_api_recipe_fts(recipes_api_recipe_fts) "
+    "VALUES ('rebuild')",
+]
+SQLITE_REVERSE_SQL = [
+    "DROP TRIGGER IF EXISTS recipes_api_recipe_fts_ai",
+    "DROP TRIGGER IF EXISTS recipes_api_recipe_fts_ad",
+    "DROP TRIGGER IF EXISTS recipes_api_recipe_fts_au",
+    "DROP TABLE IF EXISTS recipes_api_recipe_fts",
+]
+
+
+class VendorRunSQL(migrations.RunSQL):
+    """RunSQL applied only to databases of given vendor."""
+
+    def __init__(self, vendor, *args, **kwargs):
+        self.vendor = vendor
+        super().__init__(*args, **kwargs)
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if schema_editor.connection.vendor == self.vendor:
+            super().database_forwards(app_label, schema_editor, from_state,
+                                      to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if schema_editor.connection.vendor == self.vendor:
+            super().database_backwards(app_label, schema_editor, from_state,
+                                       to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes_api', '0008_indexes'),
+    ]
+
+    operations = [
+        VendorRunSQL('postgresql', POSTGRES_SQL, POSTGRES_REVERSE_SQL),
+        VendorRunSQL('sqlite', SQLITE_SQL, SQLITE_REVERSE_SQL),
+        migrations.CreateModel(
+            name='RecipeSearchEntry',
+            fields=[
+                ('recipe', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='recipes_api.Recipe', verbose_name='рецепт')),
+                ('document', models.TextField(db_column='recipes_api_recipe_fts', verbose_name='документ')),
+                ('rank', models.FloatField(verbose_name='релевантность')),
+            ],
+            options={
+                'verbose_name': 'поисковый индекс рецепта',
+                'verbose_name_plural': 'поисковый индекс рецептов',
+                'db_table': 'recipes_api_recipe_fts',
+                'managed': False,
+            },
+        ),
+    ]
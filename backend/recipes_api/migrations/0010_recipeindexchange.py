@@ -0,0 +1,26 @@
+# Generated by Django 2.2.19 on 2026-10-18 02:17
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes_api', '0009_recipe_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeIndexChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipe_id', models.PositiveIntegerField(verbose_name='рецепт')),
+                ('created', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='изменено')),
+            ],
+            options={
+                'verbose_name': 'изменение рецепта для индекса',
+                'verbose_name_plural': 'изменения рецептов для индекса',
+            },
+        ),
+    ]
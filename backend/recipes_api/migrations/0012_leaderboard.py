@@ -0,0 +1,88 @@
+# Generated by Django 2.2.19 on 2026-10-18 02:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+WEEK_DAYS = 7
+
+
+def fill_leaderboard(apps, schema_editor):
+    """Existing favorites get migration time, so they count this week."""
+    DataVersion = apps.get_model('recipes_api', 'DataVersion')
+    Favorite = apps.get_model('recipes_api', 'Favorite')
+    FavoritesBucket = apps.get_model('recipes_api', 'FavoritesBucket')
+    RecipePopularity = apps.get_model('recipes_api', 'RecipePopularity')
+    today = django.utils.timezone.localdate()
+    counts = Favorite.objects.values_list('recipe_id').annotate(
+        models.Count('id')
+    ).order_by()
+    RecipePopularity.objects.bulk_create(
+        (RecipePopularity(recipe_id=recipe_id, favorites=count,
+                          favorites_week=count)
+         for recipe_id, count in counts.iterator())
+    )
+    FavoritesBucket.objects.bulk_create(
+        (FavoritesBucket(recipe_id=recipe_id, day=today, count=count)
+         for recipe_id, count in counts.iterator())
+    )
+    week_start = today.toordinal() - WEEK_DAYS + 1
+    DataVersion.objects.update_or_create(key='favorites_week',
+                                         defaults={'version': week_start})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes_api', '0011_similarrecipe'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FavoritesBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(db_index=True, verbose_name='день')),
+                ('count', models.IntegerField(default=0, verbose_name='добавлений в избранное')),
+            ],
+            options={
+                'verbose_name': 'добавления в избранное за день',
+                'verbose_name_plural': 'добавления в избранное по дням',
+            },
+        ),
+        migrations.CreateModel(
+            name='RecipePopularity',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='popularity', serialize=False, to='recipes_api.Recipe', verbose_name='рецепт')),
+                ('favorites', models.IntegerField(default=0, verbose_name='в избранном')),
+                ('favorites_week', models.IntegerField(default=0, verbose_name='в избранном за неделю')),
+            ],
+            options={
+                'verbose_name': 'популярность рецепта',
+                'verbose_name_plural': 'популярность рецептов',
+            },
+        ),
+        migrations.AddField(
+            model_name='favorite',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='добавлено'),
+        ),
+        migrations.AddIndex(
+            model_name='recipepopularity',
+            index=models.Index(fields=['-favorites', '-recipe'], name='popularity_favorites_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipepopularity',
+            index=models.Index(fields=['-favorites_week', '-recipe'], name='popularity_week_idx'),
+        ),
+        migrations.AddField(
+            model_name='favoritesbucket',
+            name='recipe',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes_api.Recipe', verbose_name='рецепт'),
+        ),
+        migrations.AddConstraint(
+            model_name='favoritesbucket',
+            constraint=models.UniqueConstraint(fields=('recipe', 'day'), name='unique_favorites_bucket'),
+        ),
+        migrations.RunPython(fill_leaderboard, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 2.2.19 on 2026-10-18 02:28
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('recipes_api', 'Recipe', 'shopping_carts_count', 'ShoppingCart',
+     'recipe'),
+    ('users', 'CustomUser', 'recipes_count', 'Recipe', 'author'),
+    ('users', 'CustomUser', 'followers_count', 'Follow', 'author'),
+    ('users', 'CustomUser', 'following_count', 'Follow', 'user'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for app_label, model_name, field, counted_name, foreign_key in COUNTERS:
+        model = apps.get_model(app_label, model_name)
+        counted_model = apps.get_model('recipes_api', counted_name)
+        model.objects.update(**{field: Coalesce(models.Subquery(
+            counted_model.objects.filter(
+                **{foreign_key: models.OuterRef('pk')}
+            ).order_by().values(foreign_key).annotate(
+                count=models.Count('*')
+            ).values('count'),
+            output_field=models.IntegerField()
+        ), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes_api', '0012_leaderboard'),
+        ('users', '0003_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_carts_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='в корзинах'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
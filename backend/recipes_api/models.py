@@ -1,5 +1,6 @@
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models
+from django.utils import timezone
 
 from users.models import CustomUser
 
@@ -45,10 +46,45 @@ class Ingredient(models.Model):
         return f'{self.name}, {self.measurement_unit}'
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def for_read(self, user):
+        """
+        Declared read path for RecipeListSerializer: author is joined,
+        tags and ingredients are prefetched and per-user flags
+        (is_favorited, is_in_shopping_cart, is_subscribed) are annotated,
+        so rendering a page costs a constant number of queries.
+        :param user - current request user, may be anonymous.
+        """
+        queryset = self.select_related('author').prefetch_related(
+            'tags',
+            models.Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            )
+        )
+        if user.is_anonymous:
+            false = models.Value(False, output_field=models.BooleanField())
+            return queryset.annotate(is_favorited=false,
+                                     is_in_shopping_cart=false,
+                                     is_subscribed=false)
+        return queryset.annotate(
+            is_favorited=models.Exists(Favorite.objects.filter(
+                user=user, recipe=models.OuterRef('pk')
+            )),
+            is_in_shopping_cart=models.Exists(ShoppingCart.objects.filter(
+                user=user, recipe=models.OuterRef('pk')
+            )),
+            is_subscribed=models.Exists(Follow.objects.filter(
+                user=user, author=models.OuterRef('author')
+            ))
+        )
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(CustomUser, on_delete=models.CASCADE,
                                null=False, verbose_name='автор',
-                               related_name='recipes')
+                               related_name='recipes', db_index=False)
     name = models.CharField('рецепт', max_length=40, db_index=True)
     image = models.ImageField('рисунок', upload_to='recipes_api/', null=False)
     text = models.TextField('описание')
@@ -64,24 +100,30 @@ class Recipe(models.Model):
     ingredients = models.ManyToManyField(Ingredient,
                                          verbose_name='ингредиенты',
                                          through='RecipeIngredient')
+    # Denormalized counter, see recipes_api.counters. Favorites are
+    # counted by RecipePopularity.
+    shopping_carts_count = models.IntegerField('в корзинах', default=0,
+                                               editable=False)
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'рецепт'
         verbose_name_plural = 'рецепты'
         ordering = ('-id',)
+        indexes = [
+            models.Index(fields=['author', '-id'],
+                         name='recipe_author_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
-    def favorites_count(self):
-        return str(self.favorites.all().count())
-    favorites_count.short_description = 'В избранном:'
-
 
 class RecipeIngredient(models.Model):
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
                                related_name='recipe_ingredients',
-                               verbose_name='рецепт')
+                               verbose_name='рецепт', db_index=False)
     ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE,
                                    verbose_name='ингредиент')
     amount = models.IntegerField(
@@ -96,6 +138,10 @@ class RecipeIngredient(models.Model):
         verbose_name = 'Количество ингредиента в рецепте'
         verbose_name_plural = 'Количества ингредиентов в рецептах'
         ordering = ('-id',)
+        indexes = [
+            models.Index(fields=['recipe', 'ingredient', 'amount'],
+                         name='recipe_ingredient_amount_idx'),
+        ]
 
 
 class Follow(models.Model):
@@ -104,7 +150,7 @@ class Follow(models.Model):
                              verbose_name='подписчик')
     author = models.ForeignKey(CustomUser, on_delete=models.CASCADE,
                                related_name='followings',
-                               verbose_name='автор')
+                               verbose_name='автор', db_index=False)
 
     class Meta:
         verbose_name = 'подписка'
@@ -114,6 +160,10 @@ class Follow(models.Model):
                 fields=['user', 'author'], name='unique_follow'
             )
         ]
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user} подписан на {self.author}'
@@ -125,7 +175,8 @@ class Favorite(models.Model):
                              verbose_name='пользователь')
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
                                related_name='favorites',
-                               verbose_name='рецепт')
+                               verbose_name='рецепт', db_index=False)
+    created = models.DateTimeField('добавлено', default=timezone.now)
 
     class Meta:
         verbose_name = 'избранное'
@@ -135,6 +186,10 @@ class Favorite(models.Model):
                 fields=['user', 'recipe'], name='unique_favorite'
             )
         ]
+        indexes = [
+            models.Index(fields=['recipe', 'user'],
+                         name='favorite_recipe_user_idx'),
+        ]
 
     def __str__(self):
         return f'{self.recipe} в избранном {self.user}'
@@ -146,7 +201,7 @@ class ShoppingCart(models.Model):
                              verbose_name='пользователь')
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
                                related_name='shopping_carts',
-                               verbose_name='рецепт')
+                               verbose_name='рецепт', db_index=False)
 
     class Meta:
         verbose_name = 'рецепт в корзине'
@@ -156,6 +211,200 @@ class ShoppingCart(models.Model):
                 fields=['user', 'recipe'], name='unique_shop'
             )
         ]
+        indexes = [
+            models.Index(fields=['recipe', 'user'],
+                         name='shop_recipe_user_idx'),
+        ]
 
     def __str__(self):
         return f'{self.recipe} в корзине {self.user}'
+
+
+class ShoppingCartIngredient(models.Model):
+    """
+    Materialized totals of ingredients in user shopping_cart. Rows are
+    kept up to date by recipes_api.cart_totals and can be rebuilt with
+    rebuild_cart_totals management command.
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE,
+                             related_name='shopping_cart_ingredients',
+                             verbose_name='пользователь')
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE,
+                                   verbose_name='ингредиент')
+    amount = models.IntegerField(verbose_name='количество')
+
+    class Meta:
+        verbose_name = 'ингредиент в корзине'
+        verbose_name_plural = 'ингредиенты в корзине'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'], name='unique_shop_ingredient'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} - {self.amount} в корзине {self.user}'
+
+
+class TimelineEntry(models.Model):
+    """
+    Recipe in feed of user, written when followed author creates recipe
+    (fan-out on write), see recipes_api.feed.
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE,
+                             related_name='timeline_entries',
+                             verbose_name='подписчик')
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
+                               related_name='timeline_entries',
+                               verbose_name='рецепт')
+    author = models.ForeignKey(CustomUser, on_delete=models.CASCADE,
+                               related_name='+',
+                               verbose_name='автор')
+
+    class Meta:
+        verbose_name = 'рецепт в ленте'
+        verbose_name_plural = 'рецепты в ленте'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'], name='unique_timeline_entry'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['user', 'author'],
+                         name='timeline_user_author_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
+
+
+class DataVersion(models.Model):
+    """
+    Version counters of rarely changing data shared by all workers. Used
+    to invalidate process-local caches, see recipes_api.versions.
+    """
+    key = models.CharField('ключ', max_length=50, unique=True)
+    version = models.PositiveIntegerField('версия', default=0)
+
+    class Meta:
+        verbose_name = 'версия данных'
+        verbose_name_plural = 'версии данных'
+
+    def __str__(self):
+        return f'{self.key}: {self.version}'
+
+
+class RecipeSearchEntry(models.Model):
+    """
+    SQLite full-text index of recipe name and text, FTS5 table created by
+    migration 0009. Mapped to join it by ORM, see recipes_api.search.
+    """
+    recipe = models.OneToOneField(Recipe, on_delete=models.DO_NOTHING,
+                                  primary_key=True, db_column='rowid',
+                                  related_name='search_entry',
+                                  verbose_name='рецепт')
+    # Hidden FTS5 column named as the table, matched against query.
+    document = models.TextField('документ',
+                                db_column='recipes_api_recipe_fts')
+    rank = models.FloatField('релевантность')
+
+    class Meta:
+        managed = False
+        db_table = 'recipes_api_recipe_fts'
+        verbose_name = 'поисковый индекс рецепта'
+        verbose_name_plural = 'поисковый индекс рецептов'
+
+
+class RecipeIndexChange(models.Model):
+    """
+    Log of changed recipes. Workers apply it to their in-memory index of
+    recipe ingredients, see recipes_api.recipe_index.
+    """
+    recipe_id = models.PositiveIntegerField('рецепт')
+    created = models.DateTimeField('изменено', default=timezone.now,
+                                   db_index=True)
+
+    class Meta:
+        verbose_name = 'изменение рецепта для индекса'
+        verbose_name_plural = 'изменения рецептов для индекса'
+
+    def __str__(self):
+        return f'{self.id}: рецепт {self.recipe_id}'
+
+
+class SimilarRecipe(models.Model):
+    """
+    Precomputed nearest neighbours of recipe by ingredients, see
+    recipes_api.similar.
+    """
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
+                               related_name='similar_recipes',
+                               verbose_name='рецепт', db_index=False)
+    similar = models.ForeignKey(Recipe, on_delete=models.CASCADE,
+                                related_name='similar_to',
+                                verbose_name='похожий рецепт')
+    score = models.FloatField('сходство')
+
+    class Meta:
+        verbose_name = 'похожий рецепт'
+        verbose_name_plural = 'похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'], name='unique_similar_recipe'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.similar} похож на {self.recipe}'
+
+
+class RecipePopularity(models.Model):
+    """
+    Number of users having recipe in favorites, all-time and for rolling
+    week. Kept up to date by recipes_api.leaderboard and can be rebuilt
+    with rebuild_leaderboard management command.
+    """
+    recipe = models.OneToOneField(Recipe, on_delete=models.CASCADE,
+                                  primary_key=True,
+                                  related_name='popularity',
+                                  verbose_name='рецепт')
+    favorites = models.IntegerField('в избранном', default=0)
+    favorites_week = models.IntegerField('в избранном за неделю', default=0)
+
+    class Meta:
+        verbose_name = 'популярность рецепта'
+        verbose_name_plural = 'популярность рецептов'
+        indexes = [
+            models.Index(fields=['-favorites', '-recipe'],
+                         name='popularity_favorites_idx'),
+            models.Index(fields=['-favorites_week', '-recipe'],
+                         name='popularity_week_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe}: {self.favorites}'
+
+
+class FavoritesBucket(models.Model):
+    """
+    Number of times recipe was added to favorites in a day, for days of
+    rolling week only: buckets of days that left the week are subtracted
+    from RecipePopularity.favorites_week and dropped.
+    """
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
+                               related_name='+',
+                               verbose_name='рецепт', db_index=False)
+    day = models.DateField('день', db_index=True)
+    count = models.IntegerField('добавлений в избранное', default=0)
+
+    class Meta:
+        verbose_name = 'добавления в избранное за день'
+        verbose_name_plural = 'добавления в избранное по дням'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'day'], name='unique_favorites_bucket'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} {self.day}: {self.count}'
@@ -1,7 +1,39 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
-class CustomPagination(PageNumberPagination):
+class CustomCursorPagination(CursorPagination):
     page_size = 6
     page_size_query_param = 'limit'
     max_page_size = 50
+    ordering = '-id'
+
+
+class CustomPageNumberPagination(PageNumberPagination):
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = 50
+
+
+class CustomPagination(CustomPageNumberPagination):
+    """
+    Page number pagination by default. If request has `cursor` query
+    parameter (empty for the first page) keyset pagination on `-id` is
+    used instead: no COUNT(*) and no OFFSET scan, so latency stays flat
+    however deep user pages.
+    """
+    cursor_query_param = 'cursor'
+    cursor_pagination_class = CustomCursorPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if self.cursor_query_param in request.query_params:
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view=view
+            )
+        return super().paginate_queryset(queryset, request, view=view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
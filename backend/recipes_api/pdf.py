@@ -1,96 +1,190 @@
-import io
+import functools
+import glob
+import hashlib
+import json
+import os
+import uuid
 
-from django.core.exceptions import MultipleObjectsReturned
+from django.conf import settings
 from django.db import models
-from django.http import FileResponse
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.units import inch
+from reportlab.lib.utils import simpleSplit
 from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.pdfmetrics import stringWidth
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfgen import canvas
 from rest_framework import status
 from rest_framework.response import Response
 
-from .models import CustomUser, RecipeIngredient
+from .models import ShoppingCartIngredient
 
+PDF_LAYOUT_VERSION = 2
+# Other versions of user file are removed only if they are older than
+# current one by this many seconds: a concurrent request could still be
+# sending file it has just created or found.
+PDF_CLEANUP_DELAY = 60
+PAGE_WIDTH, PAGE_HEIGHT = letter
+HEAD_FONT_SIZE = 16
+FONT_SIZE = 12
+LEADING = 16
 
-def get_shop_ingredients_or_none(user_id: int) -> dict:
+
+def get_shop_ingredients(user_id: int) -> models.QuerySet:
     """
-    Prepares data about ingredients (name, amount, measurement unit) from
-    recipes that are added to shopping_cart of user with given id for
-    further transaction to pdf creating.
+    Returns ingredients (name, amount, measurement unit) from recipes that
+    are added to shopping_cart of user with given id. Amounts are read from
+    materialized ShoppingCartIngredient totals.
     :param user_id - id of the user owner of shopping_cart.
-    :return: data about all ingredients in shopping_cart.
+    :return: queryset of dicts with name, unit and amount keys.
     """
-    try:
-        user = CustomUser.objects.get(id=user_id)
-    except (models.CustomUser.DoesNotExist, MultipleObjectsReturned):
-        return None
-
-    shopping_cart = user.shopping_carts.select_related('recipe').all()
-    if not shopping_cart:
-        return None
-
-    shop_ingredients = {}
-    for item in shopping_cart:
-        recipe = item.recipe
-        ingredients = RecipeIngredient.objects.filter(recipe=recipe)
-        if not ingredients:
-            return None
-
-        for ingredient in ingredients:
-            name = ingredient.ingredient.name
-            unit = ingredient.ingredient.measurement_unit
-            amount = ingredient.amount
-
-            if name not in shop_ingredients:
-                shop_ingredients[name] = {
-                    'amount': amount,
-                    'unit': unit
-                }
-            else:
-                shop_ingredients[name]['amount'] = (
-                    shop_ingredients[name]['amount'] + amount
-                )
-    return shop_ingredients
-
-
-def create_pdffile_response(user_id: int) -> object:
+    return ShoppingCartIngredient.objects.filter(
+        user_id=user_id
+    ).values(
+        'amount',
+        name=models.F('ingredient__name'),
+        unit=models.F('ingredient__measurement_unit')
+    ).order_by('name', 'unit')
+
+
+def get_shop_ingredients_or_none(user_id: int) -> list:
     """
-    Generates pdf format file if user with received id has
-    objects in shopping cart.
-    :param user_id
-    :return: Response object
+    Prepares data about ingredients from shopping_cart of user with given
+    id for further transaction to pdf creating.
+    :param user_id - id of the user owner of shopping_cart.
+    :return: data about all ingredients in shopping_cart or None.
     """
+    return list(get_shop_ingredients(user_id)) or None
+
+
+@functools.lru_cache(maxsize=None)
+def register_font() -> None:
+    """Registers TTF font for pdf once per process."""
     pdfmetrics.registerFont(TTFont('Verdana', 'Verdana.ttf'))
-    buying_list = get_shop_ingredients_or_none(user_id=user_id)
-    if not buying_list:
-        error_text = 'No shopping cart or something wrong with other data.'
-        return Response(error_text, status=status.HTTP_400_BAD_REQUEST)
 
-    buffer = io.BytesIO()
-    pdf = canvas.Canvas(buffer, pagesize=letter, bottomup=0)
-    textobject = pdf.beginText()
-    textobject.setTextOrigin(inch, inch)
-    textobject.setFont('Verdana', 20)
 
-    pdf_lines = []
+def get_buying_list_version(buying_list: list) -> str:
+    """
+    Returns version of buying list. It changes on any shopping_cart insert
+    or delete and on any edit of carted recipe that affects the list.
+    :param buying_list - data from get_shop_ingredients_or_none.
+    :return: hex digest of buying list content.
+    """
+    content = json.dumps([PDF_LAYOUT_VERSION, buying_list],
+                         ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+def start_page(pdf: canvas.Canvas, page_number: int) -> float:
+    """
+    Draws header and page number on a new pdf page.
+    :return: vertical position of the first list line.
+    """
     head_line = 'СПИСОК ИНГРЕДИЕНТОВ К ПОКУПКЕ:'
-    pdf_lines.append(head_line)
-    pdf_lines.append('')
-    count = 1
-    for item in buying_list:
-        amount, unit = buying_list[item]['amount'], buying_list[item]['unit']
-        ingredient = f'{count}. {item} - {amount} {unit}'
-        pdf_lines.append(ingredient)
-        count += 1
-
-    for line in pdf_lines:
-        textobject.textLine(line)
-    pdf.drawText(textobject)
+    if page_number > 1:
+        head_line = 'СПИСОК ИНГРЕДИЕНТОВ К ПОКУПКЕ (продолжение):'
+    pdf.setFont('Verdana', HEAD_FONT_SIZE)
+    pdf.drawString(inch, PAGE_HEIGHT - inch, head_line)
+    pdf.setFont('Verdana', FONT_SIZE)
+    pdf.drawRightString(PAGE_WIDTH - inch, inch / 2, f'стр. {page_number}')
+    return PAGE_HEIGHT - inch - 2 * LEADING
+
+
+def render_pdf(buying_list: list, file) -> None:
+    """
+    Renders buying list to pdf document page by page. Pages are
+    compressed as soon as they are finished and long lines are wrapped,
+    numbering continues across pages.
+    :param buying_list - data from get_shop_ingredients_or_none.
+    :param file - path or binary file object to write document to.
+    """
+    register_font()
+    pdf = canvas.Canvas(file, pagesize=letter, pageCompression=1)
+    max_width = PAGE_WIDTH - 2 * inch
+    page_number = 1
+    position = start_page(pdf, page_number)
+    for count, item in enumerate(buying_list, start=1):
+        name, amount, unit = item['name'], item['amount'], item['unit']
+        ingredient = f'{count}. {name} - {amount} {unit}'
+        lines = [ingredient]
+        if stringWidth(ingredient, 'Verdana', FONT_SIZE) > max_width:
+            lines = simpleSplit(ingredient, 'Verdana', FONT_SIZE, max_width)
+        for line in lines:
+            if position < inch:
+                pdf.showPage()
+                page_number += 1
+                position = start_page(pdf, page_number)
+            pdf.drawString(inch, position, line)
+            position -= LEADING
     pdf.showPage()
     pdf.save()
-    buffer.seek(0)
 
-    return FileResponse(buffer, as_attachment=True,
-                        filename='buying_list.pdf')
+
+def get_or_create_pdffile(user_id: int, buying_list: list,
+                          version: str) -> str:
+    """
+    Returns path to cached pdf file of given buying list version. File is
+    rendered only if it is missing, versions of user file older than
+    this one by PDF_CLEANUP_DELAY are removed.
+    :param user_id - id of the user owner of shopping_cart.
+    :param buying_list - data from get_shop_ingredients_or_none.
+    :param version - version from get_buying_list_version.
+    :return: absolute path to pdf file.
+    """
+    directory = settings.SHOPPING_LISTS_ROOT
+    path = os.path.join(directory, f'{user_id}-{version}.pdf')
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(tmp_path, 'wb') as file:
+        render_pdf(buying_list, file)
+    os.replace(tmp_path, path)
+
+    remove_before = os.path.getmtime(path) - PDF_CLEANUP_DELAY
+    for old_path in glob.glob(os.path.join(directory, f'{user_id}-*.pdf')):
+        try:
+            if os.path.getmtime(old_path) < remove_before:
+                os.remove(old_path)
+        except FileNotFoundError:
+            pass
+    return path
+
+
+def create_pdffile_response(request) -> object:
+    """
+    Generates pdf format file if request user has objects in shopping
+    cart. File is cached per buying list version which is also sent as
+    ETag, so repeated downloads get 304 Not Modified. If
+    SHOPPING_LISTS_ACCEL_REDIRECT is set, file is handed to nginx.
+    :param request
+    :return: Response object
+    """
+    buying_list = get_shop_ingredients_or_none(user_id=request.user.id)
+    if not buying_list:
+        error_text = 'No shopping cart or something wrong with other data.'
+        return Response(error_text, status=status.HTTP_400_BAD_REQUEST)
+
+    version = get_buying_list_version(buying_list)
+    etag = f'"{version}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        path = get_or_create_pdffile(request.user.id, buying_list, version)
+        if settings.SHOPPING_LISTS_ACCEL_REDIRECT:
+            response = HttpResponse(content_type='application/pdf')
+            response['X-Accel-Redirect'] = (
+                settings.SHOPPING_LISTS_ACCEL_REDIRECT
+                + os.path.basename(path)
+            )
+            response['Content-Disposition'] = (
+                'attachment; filename="buying_list.pdf"'
+            )
+        else:
+            response = FileResponse(open(path, 'rb'), as_attachment=True,
+                                    filename='buying_list.pdf')
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,354 @@
+import bisect
+import threading
+from array import array
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import models, transaction
+from django.utils import timezone
+
+from .models import DataVersion, RecipeIndexChange, RecipeIngredient
+from .versions import RECIPE_INDEX, SIMILAR_RECIPES, bump_version, get_version
+
+# Posting list is kept as bitmap indexed by recipe id when it is smaller
+# than sorted array of 32-bit ids: ingredient is used by more than 1/32
+# of recipes.
+DENSE_RATIO = 32
+# Log entries created less than this before last read of the log are
+# read again: entries of concurrent transactions could be committed out
+# of order, after entries with greater ids were read. Transactions
+# changing recipes should be shorter.
+CHANGES_OVERLAP = timedelta(minutes=5)
+# Log entries older than this are deleted by prune_recipe_changes. Worker
+# that has not read the log for longer than CHANGES_RETENTION minus
+# CHANGES_OVERLAP could miss deleted entries and rebuilds its index.
+CHANGES_RETENTION = timedelta(hours=1)
+
+
+def set_bit(bitmap: bytearray, position: int) -> None:
+    index = position >> 3
+    if index >= len(bitmap):
+        bitmap.extend(bytes(index + 1 - len(bitmap)))
+    bitmap[index] |= 1 << (position & 7)
+
+
+def clear_bit(bitmap: bytearray, position: int) -> None:
+    index = position >> 3
+    if index < len(bitmap):
+        bitmap[index] &= 0xFF ^ (1 << (position & 7))
+
+
+def test_bit(bitmap: bytearray, position: int) -> bool:
+    index = position >> 3
+    return index < len(bitmap) and bool(bitmap[index] >> (position & 7) & 1)
+
+
+def to_bitmap(recipe_ids) -> bytearray:
+    bitmap = bytearray()
+    for recipe_id in recipe_ids:
+        set_bit(bitmap, recipe_id)
+    return bitmap
+
+
+def to_int(postings) -> int:
+    """Posting list as int with bit per recipe: operand of `&`, `|`, `^`."""
+    if isinstance(postings, array):
+        postings = to_bitmap(postings)
+    return int.from_bytes(postings, 'little')
+
+
+class RecipeIngredientIndex:
+    """
+    Inverted index of recipe ingredients: ingredient id -> posting list
+    of recipes with this ingredient. Posting list is sorted array of
+    recipe ids, or bitmap for common ingredients (see DENSE_RATIO).
+    Recipes are also grouped into bitmaps by number of their ingredients
+    to rank recipes by number of ingredients user does not have.
+    Search is done by bitwise operations over whole posting lists, so it
+    costs a few milliseconds even for the most common ingredients.
+    """
+
+    def __init__(self, pairs=()):
+        """
+        :param pairs - iterable of (ingredient id, recipe id) pairs.
+        """
+        postings = defaultdict(lambda: array('I'))
+        for ingredient_id, recipe_id in pairs:
+            postings[ingredient_id].append(recipe_id)
+        self.postings = {}
+        self.sizes = array('H')
+        for ingredient_id, recipe_ids in postings.items():
+            recipe_ids = array('I', sorted(set(recipe_ids)))
+            self.reserve(recipe_ids[-1])
+            for recipe_id in recipe_ids:
+                self.sizes[recipe_id] += 1
+            self.postings[ingredient_id] = recipe_ids
+        for ingredient_id, recipe_ids in self.postings.items():
+            if len(recipe_ids) * DENSE_RATIO > len(self.sizes):
+                self.postings[ingredient_id] = to_bitmap(recipe_ids)
+        self.size_bitmaps = defaultdict(bytearray)
+        for recipe_id, size in enumerate(self.sizes):
+            if size:
+                set_bit(self.size_bitmaps[size], recipe_id)
+
+    def reserve(self, recipe_id: int) -> None:
+        missing = recipe_id + 1 - len(self.sizes)
+        if missing > 0:
+            self.sizes.frombytes(bytes(missing * self.sizes.itemsize))
+
+    @property
+    def recipes_count(self) -> int:
+        return sum(1 for size in self.sizes if size)
+
+    @property
+    def postings_size(self) -> int:
+        """Memory taken by posting lists, bytes."""
+        return sum(
+            len(postings) * getattr(postings, 'itemsize', 1)
+            for postings in self.postings.values()
+        )
+
+    @staticmethod
+    def contains(postings, recipe_id: int) -> bool:
+        if isinstance(postings, bytearray):
+            return test_bit(postings, recipe_id)
+        position = bisect.bisect_left(postings, recipe_id)
+        return position < len(postings) and postings[position] == recipe_id
+
+    def add(self, ingredient_id: int, recipe_id: int) -> None:
+        postings = self.postings.setdefault(ingredient_id, array('I'))
+        if isinstance(postings, bytearray):
+            set_bit(postings, recipe_id)
+            return
+        position = bisect.bisect_left(postings, recipe_id)
+        if position < len(postings) and postings[position] == recipe_id:
+            return
+        postings.insert(position, recipe_id)
+        if len(postings) * DENSE_RATIO > len(self.sizes):
+            self.postings[ingredient_id] = to_bitmap(postings)
+
+    def discard(self, ingredient_id: int, recipe_id: int) -> None:
+        postings = self.postings[ingredient_id]
+        if isinstance(postings, bytearray):
+            clear_bit(postings, recipe_id)
+            return
+        position = bisect.bisect_left(postings, recipe_id)
+        if position < len(postings) and postings[position] == recipe_id:
+            del postings[position]
+
+    def set_recipe(self, recipe_id: int, ingredient_ids) -> None:
+        """
+        Brings index to current ingredients of recipe. Ingredients recipe
+        had before are not known, so every posting list is checked: one
+        bit test or binary search per catalog ingredient.
+        :param recipe_id - id of created, changed or deleted recipe.
+        :param ingredient_ids - current ingredient ids, empty if deleted.
+        """
+        ingredient_ids = set(ingredient_ids)
+        for ingredient_id in self.postings.keys() - ingredient_ids:
+            self.discard(ingredient_id, recipe_id)
+        self.reserve(recipe_id)
+        for ingredient_id in ingredient_ids:
+            self.add(ingredient_id, recipe_id)
+        old_size = self.sizes[recipe_id]
+        if old_size:
+            clear_bit(self.size_bitmaps[old_size], recipe_id)
+        if ingredient_ids:
+            set_bit(self.size_bitmaps[len(ingredient_ids)], recipe_id)
+        self.sizes[recipe_id] = len(ingredient_ids)
+
+    @staticmethod
+    def count_bits(bitmaps) -> list:
+        """
+        Counts for every recipe number of bitmaps it is in. Counter is
+        bit-sliced: i-th returned int holds i-th bit of counts of all
+        recipes, bitmaps are added to it by ripple carry.
+        """
+        counter = []
+        for bitmap in bitmaps:
+            carry = bitmap
+            for position, bits in enumerate(counter):
+                counter[position] = bits ^ carry
+                carry &= bits
+                if not carry:
+                    break
+            else:
+                counter.append(carry)
+        return counter
+
+    @staticmethod
+    def count_equals(counter: list, value: int, universe: int) -> int:
+        """:return: bitmap of recipes counted exactly `value` times."""
+        if value >> len(counter):
+            return 0
+        result = universe
+        for position, bits in enumerate(counter):
+            if value >> position & 1:
+                result &= bits
+            else:
+                result &= ~bits
+        return result
+
+    def search(self, ingredient_ids, min_matches: int = 1,
+               count: int = 10) -> list:
+        """
+        Finds recipes containing most of given ingredients.
+        :param ingredient_ids - ingredients user has.
+        :param min_matches - min number of given ingredients in recipe,
+        all of them for intersection.
+        :param count - max number of results.
+        :return: list of (recipe id, number of matched ingredients) ranked
+        by matched ingredients, then by fewest missing ingredients, then
+        newest first.
+        """
+        bitmaps = [
+            to_int(self.postings[ingredient_id])
+            for ingredient_id in set(ingredient_ids)
+            if ingredient_id in self.postings
+        ]
+        counter = self.count_bits(bitmaps)
+        universe = (1 << len(self.sizes)) - 1
+        size_bitmaps = {}
+        result = []
+        for matched in range(len(bitmaps), max(min_matches, 1) - 1, -1):
+            level = self.count_equals(counter, matched, universe)
+            sizes = sorted(size for size in self.size_bitmaps
+                           if size >= matched)
+            for size in sizes:
+                if not level or len(result) >= count:
+                    break
+                if size not in size_bitmaps:
+                    size_bitmaps[size] = to_int(self.size_bitmaps[size])
+                found = level & size_bitmaps[size]
+                level ^= found
+                while found and len(result) < count:
+                    recipe_id = found.bit_length() - 1
+                    result.append((recipe_id, matched))
+                    found ^= 1 << recipe_id
+            if len(result) >= count:
+                break
+        return result
+
+
+def build_recipe_index() -> RecipeIngredientIndex:
+    return RecipeIngredientIndex(RecipeIngredient.objects.order_by(
+    ).values_list('ingredient_id', 'recipe_id').iterator())
+
+
+def log_recipe_change(recipe_id: int) -> None:
+    RecipeIndexChange.objects.create(recipe_id=recipe_id)
+
+
+def get_changes_to_delete() -> models.QuerySet:
+    """:return: log entries already applied to similar recipes."""
+    similar_change_id = DataVersion.objects.filter(
+        key=SIMILAR_RECIPES
+    ).values_list('version', flat=True).first()
+    if similar_change_id is None:
+        return RecipeIndexChange.objects.all()
+    return RecipeIndexChange.objects.filter(id__lte=similar_change_id)
+
+
+@transaction.atomic
+def reset_recipe_index() -> None:
+    """
+    Clears log of changes and makes every worker rebuild its index from
+    recipe ingredients on next search. Changes not yet applied to similar
+    recipes are kept.
+    """
+    get_changes_to_delete().delete()
+    bump_version(RECIPE_INDEX)
+
+
+def prune_recipe_changes() -> int:
+    """
+    Deletes log entries older than CHANGES_RETENTION: every worker has
+    applied them or rebuilds its index. Changes not yet applied to
+    similar recipes are kept.
+    :return: number of deleted entries.
+    """
+    return get_changes_to_delete().filter(
+        created__lt=timezone.now() - CHANGES_RETENTION
+    ).delete()[0]
+
+
+class RecipeIndexCache:
+    """
+    Process-local index of recipe ingredients. Built once, then kept up to
+    date by applying log of changed recipes: one version lookup and one
+    scan of the log tail per call. Rebuilt from scratch when version is
+    bumped by reset_recipe_index or when log entries not applied yet
+    could be pruned, see CHANGES_RETENTION.
+    """
+
+    def __init__(self):
+        self.index = None
+        self.version = None
+        self.last_change_id = 0
+        # Applied log entries created since last read minus overlap:
+        # {id: created}, they are skipped when read again.
+        self.applied_changes = {}
+        self.read_at = None
+        self.lock = threading.Lock()
+
+    def get(self) -> RecipeIngredientIndex:
+        version = get_version(RECIPE_INDEX)
+        with self.lock:
+            now = timezone.now()
+            if (self.version != version or self.read_at is None
+                    or now - self.read_at
+                    > CHANGES_RETENTION - CHANGES_OVERLAP):
+                self.last_change_id = RecipeIndexChange.objects.aggregate(
+                    last_id=models.Max('id')
+                )['last_id'] or 0
+                self.applied_changes = {}
+                self.read_at = now
+                self.index = build_recipe_index()
+                self.version = version
+            self.apply_changes(now)
+        return self.index
+
+    def apply_changes(self, now) -> None:
+        """:param now - time before the log is read."""
+        changes = [
+            (change_id, recipe_id, created)
+            for change_id, recipe_id, created
+            in RecipeIndexChange.objects.filter(
+                models.Q(id__gt=self.last_change_id)
+                | models.Q(created__gte=self.read_at - CHANGES_OVERLAP)
+            ).values_list('id', 'recipe_id', 'created')
+            if change_id not in self.applied_changes
+        ]
+        self.read_at = now
+        self.applied_changes = {
+            change_id: created for change_id, created
+            in self.applied_changes.items()
+            if created >= now - CHANGES_OVERLAP
+        }
+        if not changes:
+            return
+
+        recipe_ids = {recipe_id for _, recipe_id, _ in changes}
+        ingredients = defaultdict(list)
+        for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).order_by().values_list('recipe_id', 'ingredient_id'):
+            ingredients[recipe_id].append(ingredient_id)
+        for recipe_id in recipe_ids:
+            self.index.set_recipe(recipe_id, ingredients[recipe_id])
+
+        self.last_change_id = max(
+            self.last_change_id, *(change_id for change_id, _, _ in changes)
+        )
+        self.applied_changes.update(
+            (change_id, created) for change_id, _, created in changes
+            if created >= now - CHANGES_OVERLAP
+        )
+
+
+recipe_index = RecipeIndexCache()
+
+
+def search_recipes_by_ingredients(ingredient_ids, min_matches: int = 1,
+                                  count: int = 10) -> list:
+    return recipe_index.get().search(ingredient_ids, min_matches, count)
@@ -0,0 +1,47 @@
+import hashlib
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from rest_framework.renderers import JSONRenderer
+
+from .models import Ingredient, Tag
+from .serializers import IngredientSerializer, TagSerializer
+from .versions import INGREDIENTS, TAGS, VersionedCache
+
+
+def render_reference_data(serializer_class, queryset) -> tuple:
+    """
+    Serializes whole reference table once.
+    :return: (strong ETag, JSON bytes) pair.
+    """
+    content = JSONRenderer().render(
+        serializer_class(queryset, many=True).data
+    )
+    return f'"{hashlib.sha1(content).hexdigest()}"', content
+
+
+tags_cache = VersionedCache(
+    TAGS, lambda: render_reference_data(TagSerializer, Tag.objects.all())
+)
+ingredients_cache = VersionedCache(
+    INGREDIENTS,
+    lambda: render_reference_data(IngredientSerializer,
+                                  Ingredient.objects.all())
+)
+
+
+def create_reference_data_response(request, cache: VersionedCache) -> object:
+    """
+    Returns pre-serialized reference table, or 304 Not Modified if client
+    already has its current version.
+    :param request
+    :param cache - tags_cache or ingredients_cache.
+    :return: Response object
+    """
+    etag, content = cache.get()
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    patch_cache_control(response, no_cache=True)
+    return response
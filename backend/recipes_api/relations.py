@@ -0,0 +1,87 @@
+from django.db import connections, models, router
+from django.db.models import sql
+
+
+def get_returned_rows(cursor, connection, model, fields: tuple) -> list:
+    """
+    Reads rows returned by RETURNING clause and converts values the way
+    ORM does, e.g. SQLite datetime strings to aware datetimes.
+    """
+    columns = [model._meta.get_field(name).get_col(model._meta.db_table)
+               for name in fields]
+    converters = [
+        connection.ops.get_db_converters(column)
+        + column.get_db_converters(connection)
+        for column in columns
+    ]
+    rows = []
+    for row in cursor.fetchall():
+        row = list(row)
+        for position, column in enumerate(columns):
+            for converter in converters[position]:
+                row[position] = converter(row[position], column, connection)
+        rows.append(tuple(row))
+    return rows
+
+
+def get_returning_sql(connection, model, fields: tuple) -> str:
+    return 'RETURNING ' + ', '.join(
+        connection.ops.quote_name(model._meta.get_field(name).column)
+        for name in fields
+    )
+
+
+def insert_ignoring_conflicts(objs: list, returning: tuple) -> list:
+    """
+    Inserts objects by one INSERT ... ON CONFLICT DO NOTHING RETURNING.
+    Unique constraints decide which of concurrent inserts of the same
+    relation wins, and only the winner gets its row back, so derived data
+    is updated exactly once without locks.
+    :param objs - unsaved instances of one model.
+    :param returning - names of fields to return.
+    :return: rows of returned values for inserted objects only.
+    """
+    if not objs:
+        return []
+    model = type(objs[0])
+    using = router.db_for_write(model)
+    connection = connections[using]
+    fields = [field for field in model._meta.concrete_fields
+              if not isinstance(field, models.AutoField)]
+    query = sql.InsertQuery(model, ignore_conflicts=True)
+    query.insert_values(fields, objs)
+    rows = []
+    with connection.cursor() as cursor:
+        for insert_sql, params in query.get_compiler(using).as_sql():
+            cursor.execute(
+                f'{insert_sql} '
+                f'{get_returning_sql(connection, model, returning)}',
+                params
+            )
+            rows.extend(get_returned_rows(cursor, connection, model,
+                                          returning))
+    return rows
+
+
+def delete_returning(queryset: models.QuerySet, returning: tuple) -> list:
+    """
+    Deletes rows matching queryset by one DELETE ... RETURNING. Of
+    concurrent deletes of the same row only one gets it back. Signals
+    are not sent and nothing is cascaded, so it is meant for relation
+    tables nothing refers to.
+    :param queryset - filter on columns of one table.
+    :param returning - names of fields to return.
+    :return: rows of returned values for deleted rows.
+    """
+    model = queryset.model
+    using = router.db_for_write(model)
+    connection = connections[using]
+    delete_sql, params = queryset.query.chain(
+        sql.DeleteQuery
+    ).get_compiler(using).as_sql()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'{delete_sql} {get_returning_sql(connection, model, returning)}',
+            params
+        )
+        return get_returned_rows(cursor, connection, model, returning)
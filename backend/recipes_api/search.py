@@ -0,0 +1,109 @@
+from django.db import connections, models
+from django.db.models.expressions import RawSQL
+
+from .models import Recipe, RecipeSearchEntry
+
+RECIPE_TABLE = Recipe._meta.db_table
+FTS_TABLE = RecipeSearchEntry._meta.db_table
+SEARCH_CONFIG = 'russian'
+
+# Same as created by migration 0009.
+SQLITE_TRIGGERS_SQL = (
+    f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai '
+    f'AFTER INSERT ON {RECIPE_TABLE} BEGIN '
+    f'INSERT INTO {FTS_TABLE}(rowid, name, text) '
+    f'VALUES (new.id, new.name, new.text); END',
+    f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad '
+    f'AFTER DELETE ON {RECIPE_TABLE} BEGIN '
+    f'INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text) '
+    f"VALUES ('delete', old.id, old.name, old.text); END",
+    f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au '
+    f'AFTER UPDATE OF name, text ON {RECIPE_TABLE} BEGIN '
+    f'INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text) '
+    f"VALUES ('delete', old.id, old.name, old.text); "
+    f'INSERT INTO {FTS_TABLE}(rowid, name, text) '
+    f'VALUES (new.id, new.name, new.text); END',
+)
+
+
+@models.TextField.register_lookup
+class FullTextMatch(models.Lookup):
+    """SQLite FTS5 `column MATCH query`, see RecipeSearchEntry."""
+    lookup_name = 'fts_match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+def restore_search_index(connection) -> None:
+    """
+    Recreates SQLite triggers of full-text index created by migration
+    0009 if they were dropped: SQLite migrations rebuild altered tables
+    together with their triggers. Index is left alone if it was not
+    installed (or was dropped by reverse migration).
+    """
+    if (connection.vendor != 'sqlite'
+            or FTS_TABLE not in connection.introspection.table_names()):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' "
+            'AND tbl_name = %s', [RECIPE_TABLE]
+        )
+        if cursor.fetchone()[0] >= len(SQLITE_TRIGGERS_SQL):
+            return
+        for sql in SQLITE_TRIGGERS_SQL:
+            cursor.execute(sql)
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+        )
+
+
+def get_fts5_query(query: str) -> str:
+    """
+    Converts user input to FTS5 query: every word is quoted (so FTS5
+    syntax in input is matched literally) and words are joined by AND.
+    Last word is matched as prefix.
+    """
+    words = ['"{}"'.format(word.replace('"', '""'))
+             for word in query.split()]
+    if words:
+        words[-1] += '*'
+    return ' '.join(words)
+
+
+def search_recipes(queryset, query: str, using: str = 'default'):
+    """
+    Filters recipes matching query and orders them by relevance (higher
+    `search_rank` first, newer recipes first on equal rank). Other filters
+    of queryset are combined with full-text match by database.
+    :param queryset - queryset of recipes, e.g. already filtered by tags.
+    :param query - words to search in recipe names and texts.
+    :return: ranked queryset.
+    """
+    vendor = connections[using].vendor
+    if vendor == 'postgresql':
+        tsquery = f"plainto_tsquery('{SEARCH_CONFIG}', %s)"
+        queryset = queryset.annotate(
+            search_rank=RawSQL(
+                f'ts_rank({RECIPE_TABLE}.search_vector, {tsquery})', [query]
+            ),
+            search_match=RawSQL(
+                f'{RECIPE_TABLE}.search_vector @@ {tsquery}', [query],
+                output_field=models.BooleanField()
+            )
+        ).filter(search_match=True)
+    elif vendor == 'sqlite':
+        # Join with FTS5 table: rank (bm25 with weights set by migration
+        # 0009) is computed in the same pass as MATCH, not by correlated
+        # subquery per matched recipe.
+        queryset = queryset.filter(
+            search_entry__document__fts_match=get_fts5_query(query)
+        ).annotate(search_rank=-models.F('search_entry__rank'))
+    else:
+        queryset = queryset.filter(name__icontains=query).annotate(
+            search_rank=RawSQL('0', [])
+        )
+    return queryset.order_by('-search_rank', '-id')
@@ -1,8 +1,13 @@
+from collections import defaultdict
+
+from django.db import models, transaction
 from rest_framework import serializers
-from rest_framework.generics import get_object_or_404
 
 from users.serializers import CustomUserSerializer
 
+from .cart_totals import (get_amounts_delta, lock_recipes,
+                          update_recipe_in_cart_totals)
+from .feed import fan_out_recipe
 from .fields import Base64ImageField
 from .models import (CustomUser, Favorite, Ingredient, Recipe,
                      RecipeIngredient, ShoppingCart, Tag)
@@ -56,7 +61,15 @@ class RecipeListSerializer(serializers.ModelSerializer):
                   'is_favorited', 'is_in_shopping_cart',
                   'name', 'image', 'text', 'cooking_time')
 
+    def to_representation(self, recipe):
+        if hasattr(recipe, 'is_subscribed'):
+            recipe.author.is_subscribed = recipe.is_subscribed
+        return super().to_representation(recipe)
+
     def get_is_favorited(self, recipe):
+        """Reads flag annotated by RecipeViewSet.get_queryset if present."""
+        if hasattr(recipe, 'is_favorited'):
+            return recipe.is_favorited
         current_user = self.context.get('request').user
         if current_user.is_anonymous:
             return False
@@ -65,6 +78,9 @@ class RecipeListSerializer(serializers.ModelSerializer):
         ).exists()
 
     def get_is_in_shopping_cart(self, recipe):
+        """Reads flag annotated by RecipeViewSet.get_queryset if present."""
+        if hasattr(recipe, 'is_in_shopping_cart'):
+            return recipe.is_in_shopping_cart
         current_user = self.context.get('request').user
         if current_user.is_anonymous:
             return False
@@ -114,42 +130,93 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError(
                     'Количество должно начинаться с положительной цифры.'
                 )
+
+        ingredient_ids = {item.get('id') for item in data}
+        found_ids = set(Ingredient.objects.filter(
+            id__in=ingredient_ids
+        ).values_list('id', flat=True))
+        missing_ids = ingredient_ids - found_ids
+        if missing_ids:
+            raise serializers.ValidationError(
+                f'Ингредиенты не найдены: {sorted(missing_ids)}.'
+            )
         return data
 
+    @staticmethod
+    def get_amounts(ingredients):
+        """Sums amounts of repeated ingredients: {ingredient_id: amount}."""
+        amounts = defaultdict(int)
+        for item in ingredients:
+            amounts[item.get('id')] += int(item.get('amount'))
+        return amounts
+
+    @staticmethod
+    def save_ingredients(recipe, amounts):
+        """
+        Brings recipe ingredients to given amounts by inserting new rows,
+        updating changed amounts and deleting removed ingredients.
+        :return: previous amounts of recipe ingredients.
+        """
+        old_rows = defaultdict(list)
+        for ingredient_id, amount in RecipeIngredient.objects.filter(
+            recipe=recipe
+        ).values_list('ingredient_id', 'amount'):
+            old_rows[ingredient_id].append(amount)
+
+        to_delete, to_create, to_update = [], [], {}
+        for ingredient_id, rows in old_rows.items():
+            if ingredient_id not in amounts or len(rows) > 1:
+                to_delete.append(ingredient_id)
+            elif rows[0] != amounts[ingredient_id]:
+                to_update[ingredient_id] = amounts[ingredient_id]
+        for ingredient_id, amount in amounts.items():
+            if ingredient_id not in old_rows or ingredient_id in to_delete:
+                to_create.append(RecipeIngredient(
+                    recipe=recipe, ingredient_id=ingredient_id, amount=amount
+                ))
+
+        recipe_ingredients = RecipeIngredient.objects.filter(recipe=recipe)
+        if to_delete:
+            recipe_ingredients.filter(ingredient_id__in=to_delete).delete()
+        if to_update:
+            recipe_ingredients.filter(ingredient_id__in=to_update).update(
+                amount=models.Case(
+                    *(models.When(ingredient_id=ingredient_id, then=amount)
+                      for ingredient_id, amount in to_update.items()),
+                    output_field=models.IntegerField()
+                )
+            )
+        RecipeIngredient.objects.bulk_create(to_create)
+        return {ingredient_id: sum(rows)
+                for ingredient_id, rows in old_rows.items()}
+
+    @transaction.atomic
     def create(self, validated_data):
         request = self.context.get('request')
         author = request.user
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(author=author, **validated_data)
-        recipe.save()
         recipe.tags.set(tags)
-
-        for item in ingredients:
-            ingredient = get_object_or_404(Ingredient, id=item.get('id'))
-            amount = item.get('amount')
-            recipe_ingredient = RecipeIngredient.objects.create(
-                ingredient=ingredient,
-                recipe=recipe,
-                amount=amount
-            )
-            recipe_ingredient.save()
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient_id=ingredient_id,
+                             amount=amount)
+            for ingredient_id, amount in self.get_amounts(ingredients).items()
+        )
+        fan_out_recipe(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, recipe, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
 
-        RecipeIngredient.objects.filter(recipe=recipe).delete()
-        for item in ingredients:
-            ingredient = get_object_or_404(Ingredient, id=item.get('id'))
-            amount = item.get('amount')
-            recipe_ingredient = RecipeIngredient.objects.create(
-                ingredient=ingredient,
-                recipe=recipe,
-                amount=amount
-            )
-            recipe_ingredient.save()
+        amounts = self.get_amounts(ingredients)
+        lock_recipes([recipe.id])
+        old_amounts = self.save_ingredients(recipe, amounts)
+        update_recipe_in_cart_totals(
+            recipe.id, get_amounts_delta(old_amounts, amounts)
+        )
 
         recipe.cooking_time = validated_data.pop('cooking_time')
         recipe.name = validated_data.pop('name')
@@ -161,26 +228,32 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         return recipe
 
     def to_representation(self, instance):
+        request = self.context.get('request')
+        recipe = Recipe.objects.for_read(request.user).get(pk=instance.pk)
         return RecipeListSerializer(
-            instance,
+            recipe,
             context={
-                'request': self.context.get('request')
+                'request': request
             }
         ).data
 
 
+class BulkIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100
+    )
+
+
 class CustomUserSubscribeSerializer(CustomUserSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = CustomUser
         fields = CustomUserSerializer.Meta.fields + ('recipes',
                                                      'recipes_count', )
 
-    def get_recipes_count(self, author):
-        return author.recipes.all().count()
-
     def get_recipes(self, author):
         request = self.context.get('request')
         recipes_limit = self.context.get('recipes_limit')
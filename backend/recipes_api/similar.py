@@ -0,0 +1,260 @@
+import itertools
+
+import numpy as np
+from django.db import models, transaction
+from scipy import sparse
+
+from .models import (DataVersion, RecipeIndexChange, RecipeIngredient,
+                     SimilarRecipe)
+from .versions import SIMILAR_RECIPES
+
+# Ingredients used by more than MAX_DF recipes are not used to find
+# candidates: salt or water alone do not make recipes similar, their
+# weight is low. Fixed number keeps candidates of a recipe bounded
+# whatever number of recipes.
+MAX_DF = 1000
+
+
+class IngredientVectors:
+    """
+    Sparse recipe x ingredient matrix in CSR form (rows are recipes),
+    weighted by idf and normalized, so cosine similarity of recipes is
+    dot product of rows. Recipes sharing rare ingredients are more
+    similar than recipes sharing salt. Scores of many recipes are
+    computed at once by sparse matrix products.
+    """
+
+    def __init__(self, pairs, max_df: int = MAX_DF):
+        """
+        :param pairs - (recipe id, ingredient id) pairs.
+        :param max_df - number of recipes, see MAX_DF.
+        """
+        pairs = np.fromiter(itertools.chain.from_iterable(pairs),
+                            dtype=np.int64).reshape(-1, 2)
+        self.recipe_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+        _, columns = np.unique(pairs[:, 1], return_inverse=True)
+        recipes_count = len(self.recipe_ids)
+        df = np.bincount(columns)
+        values = np.log(recipes_count / df)[columns]
+        norms = np.sqrt(np.bincount(rows, weights=values ** 2,
+                                    minlength=recipes_count))
+        values = np.divide(values, norms[rows],
+                           out=np.zeros_like(values), where=norms[rows] > 0)
+
+        # Rare ingredients find candidates, common ones only add to
+        # scores of candidates.
+        rare = df[columns] <= max_df
+        shape = (recipes_count, len(df))
+        self.rare = sparse.csr_matrix(
+            (values[rare], (rows[rare], columns[rare])), shape=shape
+        )
+        self.rare_transposed = self.rare.T.tocsr()
+        self.common = sparse.csr_matrix(
+            (values[~rare], (rows[~rare], columns[~rare])), shape=shape
+        )
+
+    def get_position(self, recipe_id: int):
+        position = int(np.searchsorted(self.recipe_ids, recipe_id))
+        if (position < len(self.recipe_ids)
+                and self.recipe_ids[position] == recipe_id):
+            return position
+        return None
+
+    def get_positions(self, recipe_ids) -> np.ndarray:
+        """
+        :return: sorted rows of given recipes, recipes without
+        ingredients skipped.
+        """
+        recipe_ids = np.unique(np.fromiter(recipe_ids, dtype=np.int64))
+        positions = np.searchsorted(self.recipe_ids, recipe_ids)
+        found = positions < len(self.recipe_ids)
+        found[found] = self.recipe_ids[positions[found]] == recipe_ids[found]
+        return positions[found]
+
+    def get_scores(self, positions: np.ndarray) -> sparse.csr_matrix:
+        """
+        :param positions - rows of recipes, see get_positions.
+        :return: matrix of cosine similarity of given recipes (rows) with
+        every other recipe sharing a rare ingredient (columns are rows of
+        all recipes), other scores are not stored.
+        """
+        scores = (self.rare[positions] @ self.rare_transposed).tocoo()
+        recipes = positions[scores.row]
+        scores.data += np.asarray(self.common[recipes].multiply(
+            self.common[scores.col]
+        ).sum(axis=1)).ravel()
+        kept = (scores.data > 0) & (scores.col != recipes)
+        return sparse.csr_matrix(
+            (scores.data[kept], (scores.row[kept], scores.col[kept])),
+            shape=scores.shape
+        )
+
+    def get_neighbours(self, positions: np.ndarray, count: int) -> list:
+        """
+        :param positions - rows of recipes, see get_positions.
+        :return: for every recipe list of (recipe id, score) of most
+        similar recipes, newer recipe first on equal score.
+        """
+        scores = self.get_scores(positions)
+        neighbours = []
+        for row in range(len(positions)):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            row_scores = scores.data[start:end]
+            row_ids = self.recipe_ids[scores.indices[start:end]]
+            if len(row_scores) > count:
+                # Ties with the last one are kept for order below.
+                top = np.argpartition(row_scores, -count)[-count:]
+                kept = row_scores >= row_scores[top].min()
+                row_scores, row_ids = row_scores[kept], row_ids[kept]
+            order = np.lexsort((-row_ids, -row_scores))[:count]
+            neighbours.append(list(zip(row_ids[order].tolist(),
+                                       row_scores[order].tolist())))
+        return neighbours
+
+
+def build_ingredient_vectors(max_df: int = MAX_DF) -> IngredientVectors:
+    # Ordered scan of (recipe, ingredient, amount) index.
+    return IngredientVectors(RecipeIngredient.objects.order_by(
+        'recipe_id', 'ingredient_id'
+    ).values_list('recipe_id', 'ingredient_id').iterator(), max_df)
+
+
+def save_similar_recipes(vectors: IngredientVectors, recipe_ids,
+                         count: int, batch_size: int = 500) -> int:
+    """
+    Computes and stores neighbours of recipes batch by batch: memory is
+    bounded by one batch of results whatever number of recipes.
+    :param vectors - ingredient vectors of all recipes.
+    :param recipe_ids - recipes to recompute neighbours of.
+    :param count - number of neighbours per recipe.
+    :param batch_size - recipes per transaction.
+    :return: number of stored neighbours.
+    """
+    recipe_ids = sorted(recipe_ids)
+    saved = 0
+    for start in range(0, len(recipe_ids), batch_size):
+        batch = recipe_ids[start:start + batch_size]
+        positions = vectors.get_positions(batch)
+        rows = [
+            SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id,
+                          score=score)
+            for recipe_id, neighbours in zip(
+                vectors.recipe_ids[positions].tolist(),
+                vectors.get_neighbours(positions, count)
+            )
+            for similar_id, score in neighbours
+        ]
+        with transaction.atomic():
+            SimilarRecipe.objects.filter(recipe_id__in=batch).delete()
+            SimilarRecipe.objects.bulk_create(rows)
+        saved += len(rows)
+    return saved
+
+
+def get_last_applied_change_id():
+    """:return: log position similar recipes are computed for, or None."""
+    return DataVersion.objects.filter(key=SIMILAR_RECIPES).values_list(
+        'version', flat=True
+    ).first()
+
+
+def set_last_applied_change_id(change_id: int) -> None:
+    DataVersion.objects.update_or_create(key=SIMILAR_RECIPES,
+                                         defaults={'version': change_id})
+
+
+def log_recipes_similar_to(recipe_id: int) -> None:
+    """
+    Logs recipes having recipe among neighbours as changed. Should be
+    called before recipe is deleted: stored neighbours are deleted with
+    it by cascade and next run could not find those recipes otherwise.
+    """
+    RecipeIndexChange.objects.bulk_create(
+        RecipeIndexChange(recipe_id=similar_recipe_id)
+        for similar_recipe_id in SimilarRecipe.objects.filter(
+            similar_id=recipe_id
+        ).values_list('recipe_id', flat=True)
+    )
+
+
+def get_recipes_to_update(vectors: IngredientVectors, changed_ids,
+                          count: int, batch_size: int = 500) -> set:
+    """
+    Recipes whose neighbours could change with changed recipes: changed
+    recipes themselves, recipes having changed ones among neighbours and
+    recipes changed ones now beat the last stored neighbour of. Recipes
+    that had deleted ones among neighbours are logged as changed, see
+    log_recipes_similar_to.
+    :param vectors - ingredient vectors of all recipes.
+    :param changed_ids - ids of created, edited or deleted recipes.
+    :param count - number of neighbours per recipe.
+    """
+    positions = vectors.get_positions(changed_ids)
+    result = set(vectors.recipe_ids[positions].tolist())
+    result.update(SimilarRecipe.objects.filter(
+        similar_id__in=changed_ids
+    ).values_list('recipe_id', flat=True).distinct())
+
+    best_scores = np.zeros(len(vectors.recipe_ids))
+    for start in range(0, len(positions), batch_size):
+        scores = vectors.get_scores(positions[start:start + batch_size])
+        np.maximum(best_scores, scores.max(axis=0).toarray().ravel(),
+                   out=best_scores)
+    scored = np.flatnonzero(best_scores)
+    best_scores = dict(zip(vectors.recipe_ids[scored].tolist(),
+                           best_scores[scored].tolist()))
+    candidate_ids = sorted(best_scores.keys() - result)
+    for start in range(0, len(candidate_ids), batch_size):
+        batch = candidate_ids[start:start + batch_size]
+        stored = {
+            recipe_id: (neighbours, min_score)
+            for recipe_id, neighbours, min_score
+            in SimilarRecipe.objects.filter(recipe_id__in=batch).values(
+                'recipe_id'
+            ).annotate(
+                neighbours=models.Count('id'),
+                min_score=models.Min('score')
+            ).values_list('recipe_id', 'neighbours', 'min_score')
+        }
+        for recipe_id in batch:
+            neighbours, min_score = stored.get(recipe_id, (0, 0))
+            if neighbours < count or best_scores[recipe_id] >= min_score:
+                result.add(recipe_id)
+    return result
+
+
+def update_similar_recipes(count: int, full: bool = False,
+                           batch_size: int = 500,
+                           max_df: int = MAX_DF) -> tuple:
+    """
+    Recomputes stored neighbours: of all recipes on first run or if
+    `full`, otherwise only those affected by recipes changed since last
+    run (see RecipeIndexChange).
+    :return: (number of recomputed recipes, number of stored neighbours).
+    """
+    last_change_id = RecipeIndexChange.objects.aggregate(
+        last_id=models.Max('id')
+    )['last_id'] or 0
+    applied_change_id = get_last_applied_change_id()
+    vectors = build_ingredient_vectors(max_df)
+
+    if full or applied_change_id is None:
+        recipe_ids = vectors.recipe_ids.tolist()
+        SimilarRecipe.objects.exclude(recipe_id__in=models.Subquery(
+            RecipeIngredient.objects.values('recipe_id')
+        )).delete()
+    else:
+        changed_ids = set(RecipeIndexChange.objects.filter(
+            id__gt=applied_change_id, id__lte=last_change_id
+        ).values_list('recipe_id', flat=True))
+        recipe_ids = get_recipes_to_update(vectors, changed_ids, count,
+                                           batch_size)
+        # Recipes left without ingredients have no neighbours.
+        SimilarRecipe.objects.filter(recipe_id__in=[
+            recipe_id for recipe_id in changed_ids
+            if vectors.get_position(recipe_id) is None
+        ]).delete()
+
+    saved = save_similar_recipes(vectors, recipe_ids, count, batch_size)
+    set_last_applied_change_id(last_change_id)
+    return len(recipe_ids), saved
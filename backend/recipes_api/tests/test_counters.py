@@ -0,0 +1,62 @@
+from django.test import TestCase
+
+from recipes_api.counters import repair_counters
+from recipes_api.models import CustomUser, Follow, Recipe, ShoppingCart
+
+
+class CountersTest(TestCase):
+    """Counters follow saves and deletes made bypassing API views."""
+
+    def assert_counters_consistent(self):
+        self.assertEqual(set(repair_counters(verify=True).values()), {0})
+
+    def test_orm_and_cascade_changes(self):
+        user = CustomUser.objects.create_user(
+            'user@example.com', 'user', 'User', 'User', 'password'
+        )
+        author = CustomUser.objects.create_user(
+            'author@example.com', 'author', 'Author', 'Author', 'password'
+        )
+        recipe = Recipe.objects.create(
+            author=author, name='recipe', image='recipe.png',
+            text='text', cooking_time=10
+        )
+        ShoppingCart.objects.create(user=user, recipe=recipe)
+        Follow.objects.create(user=user, author=author)
+        Follow.objects.create(user=author, author=user)
+        author.refresh_from_db()
+        self.assertEqual((author.recipes_count, author.followers_count,
+                          author.following_count), (1, 1, 1))
+        self.assert_counters_consistent()
+
+        Follow.objects.filter(user=user).delete()
+        self.assert_counters_consistent()
+
+        user.delete()
+        author.refresh_from_db()
+        recipe.refresh_from_db()
+        self.assertEqual((author.followers_count, author.following_count),
+                         (0, 0))
+        self.assertEqual(recipe.shopping_carts_count, 0)
+        self.assert_counters_consistent()
+
+        recipe.delete()
+        author.refresh_from_db()
+        self.assertEqual(author.recipes_count, 0)
+
+    def test_repair(self):
+        author = CustomUser.objects.create_user(
+            'author@example.com', 'author', 'Author', 'Author', 'password'
+        )
+        Recipe.objects.create(author=author, name='recipe',
+                              image='recipe.png', text='text',
+                              cooking_time=10)
+        CustomUser.objects.filter(pk=author.pk).update(recipes_count=5,
+                                                       followers_count=-2)
+        self.assertEqual(
+            repair_counters()[('CustomUser', 'recipes_count')], 1
+        )
+        author.refresh_from_db()
+        self.assertEqual((author.recipes_count, author.followers_count),
+                         (1, 0))
+        self.assert_counters_consistent()
@@ -0,0 +1,131 @@
+import re
+
+from django.db import connection, models
+from django.test import TestCase
+
+from recipes_api.cart_totals import get_recipes_amounts_queryset
+from recipes_api.models import (CustomUser, Favorite, Follow, Recipe,
+                                ShoppingCart, ShoppingCartIngredient,
+                                TimelineEntry)
+from recipes_api.pdf import get_shop_ingredients
+from recipes_api.views import get_subscriptions_queryset
+
+# Small reference tables may be scanned. Anything else, including
+# subquery aliases like U0 that SQLite reports instead of table names,
+# is treated as a large table.
+SMALL_TABLES = {
+    'recipes_api_tag',
+    'recipes_api_ingredient',
+    'recipes_api_dataversion',
+}
+SQLITE_SCAN_KEYWORDS = {'SUBQUERY', 'CONSTANT'}
+
+# SQLite reports every full pass over a table or an index as SCAN, only
+# SEARCH is a lookup by index.
+SQLITE_SCAN_PATTERN = re.compile(r'\bSCAN (?:TABLE )?(\w+)')
+POSTGRESQL_INDEX_SCANS = {'Index Scan', 'Index Only Scan'}
+USERS = 300
+
+
+def get_checks():
+    """
+    Main queries of endpoints as (name, queryset, allowed scans). Recipe
+    pages ordered by primary key may walk recipe table in key order.
+    """
+    user = CustomUser(pk=1)
+    recipe_page = {'recipes_api_recipe'}
+    return [
+        ('recipe list', Recipe.objects.for_read(user)[:6], recipe_page),
+        ('recipes of author',
+         Recipe.objects.for_read(user).filter(author_id=1)[:6], set()),
+        ('recipe detail', Recipe.objects.for_read(user).filter(pk=1),
+         set()),
+        ('favorites of recipe', Favorite.objects.filter(recipe_id=1),
+         set()),
+        ('favorite flag',
+         Favorite.objects.filter(user_id=1, recipe_id=1), set()),
+        ('carts of recipe', ShoppingCart.objects.filter(
+            recipe_id=1
+        ).values_list('user_id', flat=True), set()),
+        ('followers of author', Follow.objects.filter(
+            author_id=1
+        ).values_list('user_id', flat=True), set()),
+        ('recipe ingredients amounts',
+         get_recipes_amounts_queryset([1]), set()),
+        ('shopping list', get_shop_ingredients(1), set()),
+        ('shopping cart totals',
+         ShoppingCartIngredient.objects.filter(user_id=1), set()),
+        ('subscriptions', get_subscriptions_queryset(user)[:6], set()),
+        ('subscription recipes', Recipe.objects.filter(
+            author_id__in=[1, 2],
+            id__in=models.Subquery(Recipe.objects.filter(
+                author=models.OuterRef('author')
+            ).order_by('-id').values('id')[:3])
+        ), set()),
+        ('feed', TimelineEntry.objects.filter(
+            user_id=1, recipe_id__lt=100
+        ).order_by('-recipe_id').values_list('recipe_id', flat=True)[:7],
+            set()),
+    ]
+
+
+def get_postgresql_scans(node):
+    """
+    :return: tables of plan node and its children read by sequential scan
+    or by index scan without index condition, a walk of the whole index.
+    """
+    if node['Node Type'] == 'Seq Scan' or (
+        node['Node Type'] in POSTGRESQL_INDEX_SCANS
+        and 'Index Cond' not in node
+    ):
+        yield node['Relation Name']
+    for child in node.get('Plans', ()):
+        yield from get_postgresql_scans(child)
+
+
+def get_scanned_tables(queryset) -> set:
+    if connection.vendor == 'sqlite':
+        return set(SQLITE_SCAN_PATTERN.findall(queryset.explain()))
+    sql, params = queryset.query.get_compiler(
+        connection=connection
+    ).as_sql()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    return set(get_postgresql_scans(plan[0]['Plan']))
+
+
+class QueryPlanTest(TestCase):
+    """Main queries of API endpoints do not scan large tables."""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Users follow a few of many authors: PostgreSQL planner needs
+        # such statistics to start subscriptions from follows.
+        CustomUser.objects.bulk_create(
+            CustomUser(email=f'user{number}@example.com',
+                       username=f'user{number}')
+            for number in range(USERS)
+        )
+        users = list(CustomUser.objects.order_by('id'))
+        Follow.objects.bulk_create(
+            Follow(user=user, author=users[(number + shift) % USERS])
+            for number, user in enumerate(users) for shift in (1, 2)
+        )
+
+    def test_no_scans_of_large_tables(self):
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            self.skipTest(f'Query plans of {connection.vendor} are not '
+                          f'supported.')
+        if connection.vendor == 'postgresql':
+            # Small test tables are always scanned sequentially otherwise,
+            # forbid it to see whether an index is usable.
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {CustomUser._meta.db_table}, '
+                               f'{Follow._meta.db_table}')
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        for name, queryset, allowed_scans in get_checks():
+            with self.subTest(name):
+                scans = get_scanned_tables(queryset) - SMALL_TABLES
+                scans -= SQLITE_SCAN_KEYWORDS | allowed_scans
+                self.assertFalse(scans, queryset.explain())
@@ -0,0 +1,73 @@
+import threading
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TransactionTestCase, skipUnlessDBFeature
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes_api.models import CustomUser, Ingredient, Recipe, RecipeIngredient
+
+RECIPES = 5
+TOGGLES = 20
+
+
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+class ConcurrentRebuildTest(TransactionTestCase):
+    """
+    Rebuild commands run while requests change counted rows: increments
+    made during a rebuild are kept, so counters verify afterwards.
+    """
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            'user@example.com', 'user', 'User', 'User', 'password'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.recipes = [
+            Recipe.objects.create(
+                author=self.user, name=f'recipe {number}',
+                image='recipe.png', text='text', cooking_time=10
+            )
+            for number in range(RECIPES)
+        ]
+        ingredient = Ingredient.objects.create(name='salt',
+                                               measurement_unit='g')
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=5)
+            for recipe in self.recipes
+        )
+
+    def toggle(self, url):
+        """Adds and removes relation at url, ends with it added."""
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        try:
+            for _ in range(TOGGLES):
+                client.delete(url)
+                client.get(url)
+        finally:
+            connection.close()
+
+    def run_during_toggles(self, command, url_pattern):
+        threads = [
+            threading.Thread(target=self.toggle,
+                             args=(url_pattern.format(recipe.id),))
+            for recipe in self.recipes
+        ]
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            call_command(command, stdout=StringIO())
+        for thread in threads:
+            thread.join()
+        call_command(command, '--verify', stdout=StringIO())
+
+    def test_rebuild_leaderboard(self):
+        self.run_during_toggles('rebuild_leaderboard',
+                                '/api/recipes/{}/favorite/')
+
+    def test_rebuild_cart_totals(self):
+        self.run_during_toggles('rebuild_cart_totals',
+                                '/api/recipes/{}/shopping_cart/')
@@ -0,0 +1,233 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes_api.cart_totals import get_source_cart_totals
+from recipes_api.models import (CustomUser, Favorite, Follow, Ingredient,
+                                Recipe, RecipeIngredient, ShoppingCart,
+                                ShoppingCartIngredient)
+
+THREADS = 8
+
+
+class ToggleTestMixin:
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            'user@example.com', 'user', 'User', 'User', 'password'
+        )
+        self.author = CustomUser.objects.create_user(
+            'author@example.com', 'author', 'Author', 'Author', 'password'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='recipe', image='recipe.png',
+            text='text', cooking_time=10
+        )
+        ingredient = Ingredient.objects.create(name='salt',
+                                               measurement_unit='g')
+        RecipeIngredient.objects.create(recipe=self.recipe,
+                                        ingredient=ingredient, amount=5)
+
+    def assert_cart_totals_consistent(self):
+        self.assertEqual(
+            set(get_source_cart_totals()),
+            set(ShoppingCartIngredient.objects.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            ))
+        )
+
+
+class ToggleTest(ToggleTestMixin, TestCase):
+    """
+    Repeated requests for the same (user, object) pair: the first one
+    adds or removes the relation, the repeated one gets 400 and changes
+    no counters.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def get_statuses(self, method, url):
+        return [getattr(self.client, method)(url).status_code
+                for _ in range(2)]
+
+    def get_bulk_statuses(self, method, url, pk):
+        return [
+            getattr(self.client, method)(
+                url, {'ids': [pk]}, format='json'
+            ).data['results'][0]['status']
+            for _ in range(2)
+        ]
+
+    def test_favorite(self):
+        url = f'/api/recipes/{self.recipe.id}/favorite/'
+        self.assertEqual(self.get_statuses('get', url), [201, 400])
+        self.assertEqual(Favorite.objects.count(), 1)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.popularity.favorites, 1)
+        self.assertEqual(self.recipe.popularity.favorites_week, 1)
+
+        self.assertEqual(self.get_statuses('delete', url), [204, 400])
+        self.assertEqual(Favorite.objects.count(), 0)
+        self.recipe.popularity.refresh_from_db()
+        self.assertEqual(self.recipe.popularity.favorites, 0)
+        self.assertEqual(self.recipe.popularity.favorites_week, 0)
+
+    def test_shopping_cart(self):
+        url = f'/api/recipes/{self.recipe.id}/shopping_cart/'
+        self.assertEqual(self.get_statuses('get', url), [201, 400])
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.shopping_carts_count, 1)
+        self.assert_cart_totals_consistent()
+
+        self.assertEqual(self.get_statuses('delete', url), [204, 400])
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.shopping_carts_count, 0)
+        self.assert_cart_totals_consistent()
+
+    def test_subscription(self):
+        url = f'/api/users/{self.author.id}/subscribe/'
+        self.assertEqual(self.get_statuses('get', url), [201, 400])
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 1)
+
+        self.assertEqual(self.get_statuses('delete', url), [204, 400])
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 0)
+
+    def test_bulk(self):
+        cases = (
+            ('/api/recipes/favorite/', self.recipe.id, Favorite),
+            ('/api/recipes/shopping_cart/', self.recipe.id, ShoppingCart),
+            ('/api/users/subscribe/', self.author.id, Follow),
+        )
+        for url, pk, model in cases:
+            with self.subTest(url=url):
+                self.assertEqual(self.get_bulk_statuses('post', url, pk),
+                                 ['created', 'already_exists'])
+                self.assertEqual(model.objects.count(), 1)
+                self.assertEqual(self.get_bulk_statuses('delete', url, pk),
+                                 ['deleted', 'not_exists'])
+                self.assertEqual(model.objects.count(), 0)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.popularity.favorites, 0)
+        self.assertEqual(self.recipe.shopping_carts_count, 0)
+        self.assert_cart_totals_consistent()
+
+
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+class ConcurrentToggleTest(ToggleTestMixin, TransactionTestCase):
+    """
+    Parallel requests for the same (user, object) pair: exactly one of
+    them adds or removes the relation, the others get 400, and counters
+    and shopping cart totals stay consistent. Threads need own
+    connections to one test database, which in-memory SQLite lacks.
+    """
+
+    def send_parallel(self, requests):
+        """
+        :param requests - (method, url, data) sent at once, each in own
+        thread with own database connection.
+        :return: responses in order of requests.
+        """
+        barrier = threading.Barrier(len(requests))
+
+        def send(method, url, data):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+            barrier.wait()
+            try:
+                return getattr(client, method)(url, data, format='json')
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(len(requests)) as executor:
+            futures = [executor.submit(send, *request)
+                       for request in requests]
+            return [future.result() for future in futures]
+
+    def get_statuses(self, method, url):
+        responses = self.send_parallel([(method, url, None)] * THREADS)
+        return sorted(response.status_code for response in responses)
+
+    def test_favorite(self):
+        url = f'/api/recipes/{self.recipe.id}/favorite/'
+        self.assertEqual(self.get_statuses('get', url),
+                         [201] + [400] * (THREADS - 1))
+        self.recipe.refresh_from_db()
+        self.assertEqual(Favorite.objects.count(), 1)
+        self.assertEqual(self.recipe.popularity.favorites, 1)
+
+        self.assertEqual(self.get_statuses('delete', url),
+                         [204] + [400] * (THREADS - 1))
+        self.recipe.refresh_from_db()
+        self.assertEqual(Favorite.objects.count(), 0)
+        self.assertEqual(self.recipe.popularity.favorites, 0)
+
+    def test_shopping_cart(self):
+        url = f'/api/recipes/{self.recipe.id}/shopping_cart/'
+        self.assertEqual(self.get_statuses('get', url),
+                         [201] + [400] * (THREADS - 1))
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.shopping_carts_count, 1)
+        self.assert_cart_totals_consistent()
+
+        self.assertEqual(self.get_statuses('delete', url),
+                         [204] + [400] * (THREADS - 1))
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.shopping_carts_count, 0)
+        self.assert_cart_totals_consistent()
+
+    def test_subscription(self):
+        url = f'/api/users/{self.author.id}/subscribe/'
+        self.assertEqual(self.get_statuses('get', url),
+                         [201] + [400] * (THREADS - 1))
+        self.author.refresh_from_db()
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertEqual(self.author.followers_count, 1)
+
+        self.assertEqual(self.get_statuses('delete', url),
+                         [204] + [400] * (THREADS - 1))
+        self.author.refresh_from_db()
+        self.assertEqual(Follow.objects.count(), 0)
+        self.assertEqual(self.author.followers_count, 0)
+
+    def test_single_and_bulk_shopping_cart(self):
+        single_url = f'/api/recipes/{self.recipe.id}/shopping_cart/'
+        bulk_url = '/api/recipes/shopping_cart/'
+        bulk_data = {'ids': [self.recipe.id]}
+        requests = ([('get', single_url, None)] * (THREADS // 2)
+                    + [('post', bulk_url, bulk_data)] * (THREADS // 2))
+        responses = self.send_parallel(requests)
+        added = sum(
+            response.status_code == 201
+            or response.status_code == 200
+            and response.data['results'][0]['status'] == 'created'
+            for response in responses
+        )
+        self.assertEqual(added, 1)
+        self.assertEqual(ShoppingCart.objects.count(), 1)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.shopping_carts_count, 1)
+        self.assert_cart_totals_consistent()
+
+        requests = ([('delete', single_url, None)] * (THREADS // 2)
+                    + [('delete', bulk_url, bulk_data)] * (THREADS // 2))
+        responses = self.send_parallel(requests)
+        deleted = sum(
+            response.status_code == 204
+            or response.status_code == 200
+            and response.data['results'][0]['status'] == 'deleted'
+            for response in responses
+        )
+        self.assertEqual(deleted, 1)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.shopping_carts_count, 0)
+        self.assert_cart_totals_consistent()
@@ -9,6 +9,9 @@ router_v1.register('tags', views.TagViewSet)
 router_v1.register('recipes', views.RecipeViewSet)
 
 urlpatterns = [
+    path('recipes/favorite/', views.BulkFavoriteView.as_view()),
+    path('recipes/shopping_cart/', views.BulkShoppingCartView.as_view()),
+    path('users/subscribe/', views.BulkSubscriptionView.as_view()),
     path('recipes/<int:pk>/favorite/', views.FavoriteViewSet.as_view()),
     path('recipes/<int:pk>/shopping_cart/',
          views.ShoppingCartViewSet.as_view()),
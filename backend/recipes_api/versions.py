@@ -0,0 +1,65 @@
+import threading
+
+from django.db import models
+
+from .models import DataVersion
+
+AUTH_TOKENS = 'auth_tokens'
+# Not a counter: ordinal of first day of week favorites_week counts.
+FAVORITES_WEEK = 'favorites_week'
+INGREDIENTS = 'ingredients'
+RECIPE_INDEX = 'recipe_index'
+# Not a counter: id of last RecipeIndexChange applied to similar recipes.
+SIMILAR_RECIPES = 'similar_recipes'
+TAGS = 'tags'
+
+
+def get_version(key: str) -> int:
+    """
+    :param key - name of versioned data.
+    :return: current version of data, 0 if it was never changed.
+    """
+    version = DataVersion.objects.filter(key=key).values_list(
+        'version', flat=True
+    ).first()
+    return version or 0
+
+
+def bump_version(key: str) -> None:
+    """
+    Increments version of data, so process-local caches built for older
+    version are rebuilt on next request in every worker.
+    :param key - name of versioned data.
+    """
+    DataVersion.objects.bulk_create([DataVersion(key=key)],
+                                    ignore_conflicts=True)
+    DataVersion.objects.filter(key=key).update(
+        version=models.F('version') + 1
+    )
+
+
+class VersionedCache:
+    """
+    Process-local value that is rebuilt when version of data changes.
+    Checking the version costs one primary key lookup per call.
+    """
+
+    def __init__(self, key: str, build):
+        """
+        :param key - name of versioned data.
+        :param build - callable without arguments returning cached value.
+        """
+        self.key = key
+        self.build = build
+        self.value = None
+        self.version = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        version = get_version(self.key)
+        if self.version != version:
+            with self.lock:
+                if self.version != version:
+                    self.value = self.build()
+                    self.version = version
+        return self.value
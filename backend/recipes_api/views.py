@@ -1,22 +1,48 @@
-from django.db import models
+from django.db import models, transaction
+from django.http import Http404
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import NotFound
 from rest_framework.generics import get_object_or_404
+from rest_framework.pagination import Cursor
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
 
+from .autocomplete import search_ingredients
+from .cart_totals import (add_recipe_to_cart_totals,
+                          add_recipes_to_cart_totals, get_amounts_delta,
+                          get_recipe_amounts, lock_recipes,
+                          remove_recipe_from_cart_totals,
+                          remove_recipes_from_cart_totals,
+                          update_recipe_in_cart_totals)
+from .counters import count_follows, count_shopping_carts
+from .exports import create_shopping_list_response
+from .feed import backfill_timeline, get_feed_recipe_ids, remove_from_timeline
 from .filters import IngredientFilter, RecipeFilter
+from .leaderboard import (PERIOD_FIELDS, WEEK, add_favorites_to_leaderboard,
+                          get_popular_recipes,
+                          remove_favorites_from_leaderboard)
 from .models import (CustomUser, Favorite, Follow, Ingredient, Recipe,
                      ShoppingCart, Tag)
-from .paginator import CustomPagination
-from .pdf import create_pdffile_response
+from .paginator import (CustomCursorPagination, CustomPageNumberPagination,
+                        CustomPagination)
 from .permissions import (IsAdminOrReadOnly, IsAuthorOrAdminOrDenied,
                           IsAuthorOrAdminOrReadOnly)
-from .serializers import (CustomUserSubscribeSerializer,
+from .recipe_index import search_recipes_by_ingredients
+from .reference_data import (create_reference_data_response, ingredients_cache,
+                             tags_cache)
+from .relations import delete_returning, insert_ignoring_conflicts
+from .renderers import CSVRenderer, PDFRenderer, PlainTextRenderer
+from .search import search_recipes
+from .serializers import (BulkIdsSerializer, CustomUserSubscribeSerializer,
                           FavoriteAndShoppingRecipeSerializer,
                           IngredientSerializer, RecipeCreateUpdateSerializer,
                           RecipeListSerializer, TagSerializer)
 
+MAX_SEARCH_INGREDIENTS = 50
+
 
 class TagViewSet(viewsets.ModelViewSet):
     serializer_class = TagSerializer
@@ -24,6 +50,9 @@ class TagViewSet(viewsets.ModelViewSet):
     pagination_class = None
     permission_classes = (IsAdminOrReadOnly, )
 
+    def list(self, request, *args, **kwargs):
+        return create_reference_data_response(request, tags_cache)
+
 
 class IngredientViewSet(viewsets.ModelViewSet):
     serializer_class = IngredientSerializer
@@ -32,21 +61,201 @@ class IngredientViewSet(viewsets.ModelViewSet):
     pagination_class = None
     permission_classes = (IsAdminOrReadOnly,)
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name is None:
+            return create_reference_data_response(request,
+                                                  ingredients_cache)
+
+        limit = request.query_params.get('limit')
+        try:
+            limit = max(int(limit), 0)
+        except (TypeError, ValueError):
+            limit = None
+        return Response(search_ingredients(name, limit))
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     filterset_class = RecipeFilter
     permission_classes = (IsAuthorOrAdminOrReadOnly, )
 
+    def get_queryset(self):
+        return self.queryset.for_read(self.request.user)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            lock_recipes([instance.id])
+            deltas = get_amounts_delta(get_recipe_amounts(instance.id), {})
+            update_recipe_in_cart_totals(instance.id, deltas)
+            instance.delete()
+
     def get_serializer_class(self):
         if self.action in ['list', 'retrieve']:
             return RecipeListSerializer
         return RecipeCreateUpdateSerializer
 
-    @action(detail=False, permission_classes=(IsAuthorOrAdminOrDenied, ))
+    @action(detail=False, permission_classes=(permissions.IsAuthenticated, ))
+    def feed(self, request):
+        """
+        Latest recipes of followed authors. Keyset paginated by the same
+        opaque ?cursor= as other cursor pages: next page is requested by
+        `next` link, cursor position is id of last recipe on the page.
+        """
+        paginator = CustomCursorPagination()
+        paginator.base_url = request.build_absolute_uri()
+        limit = paginator.get_page_size(request)
+        cursor = paginator.decode_cursor(request)
+        before = None
+        if cursor is not None:
+            try:
+                before = int(cursor.position)
+            except (TypeError, ValueError):
+                raise NotFound(paginator.invalid_cursor_message)
+
+        recipe_ids = get_feed_recipe_ids(request.user, before, limit + 1)
+        page_ids = recipe_ids[:limit]
+        recipes = self.get_queryset().filter(id__in=page_ids)
+        serializer = RecipeListSerializer(
+            recipes, many=True, context={'request': request}
+        )
+        next_link = None
+        if len(recipe_ids) > limit:
+            next_link = paginator.encode_cursor(
+                Cursor(offset=0, reverse=False, position=page_ids[-1])
+            )
+        return Response({'next': next_link, 'results': serializer.data})
+
+    @action(detail=False)
+    def search(self, request):
+        """
+        Recipes matching ?q= words in name or text, most relevant first.
+        Recipe filters (tags, author, ...) could be combined with search.
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            error_text = 'Search query is required.'
+            return Response(error_text, status=status.HTTP_400_BAD_REQUEST)
+
+        recipes = self.filter_queryset(self.get_queryset())
+        recipe_ids = search_recipes(
+            recipes, query, using=recipes.db
+        ).values_list('id', flat=True)
+        # Relevance order: keyset pagination on `-id` is not applicable.
+        # Only ids are sorted, page recipes are read by primary key.
+        paginator = CustomPageNumberPagination()
+        page_ids = paginator.paginate_queryset(recipe_ids, request, view=self)
+        recipes = self.get_queryset().in_bulk(page_ids)
+        # Recipe could be deleted after the page of ids was read.
+        serializer = RecipeListSerializer(
+            [recipes[recipe_id] for recipe_id in page_ids
+             if recipe_id in recipes],
+            many=True, context={'request': request}
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False)
+    def by_ingredients(self, request):
+        """
+        What can I cook: recipes with ?ingredients=<id>&ingredients=<id>...
+        ranked by number of given ingredients they contain, then by fewest
+        missing ones. With ?mode=all only recipes with every given
+        ingredient are returned. Paginated by ?page= and ?limit=.
+        """
+        try:
+            ingredient_ids = {
+                int(ingredient_id) for ingredient_id
+                in request.query_params.getlist('ingredients')
+            }
+        except ValueError:
+            ingredient_ids = None
+        if not ingredient_ids:
+            error_text = 'Ingredient ids are required.'
+            return Response(error_text, status=status.HTTP_400_BAD_REQUEST)
+        if len(ingredient_ids) > MAX_SEARCH_INGREDIENTS:
+            error_text = (f'No more than {MAX_SEARCH_INGREDIENTS} '
+                          f'ingredients could be given.')
+            return Response(error_text, status=status.HTTP_400_BAD_REQUEST)
+
+        mode = request.query_params.get('mode', 'any')
+        min_matches = len(ingredient_ids) if mode == 'all' else 1
+        limit = CustomPageNumberPagination().get_page_size(request)
+        try:
+            page = max(int(request.query_params.get('page')), 1)
+        except (TypeError, ValueError):
+            page = 1
+
+        found = search_recipes_by_ingredients(
+            ingredient_ids, min_matches, page * limit + 1
+        )
+        page_found = found[(page - 1) * limit:page * limit]
+        matches = dict(page_found)
+        recipes = self.get_queryset().in_bulk(list(matches))
+        # Recipe could be deleted after the index was read.
+        serializer = RecipeListSerializer(
+            [recipes[recipe_id] for recipe_id, _ in page_found
+             if recipe_id in recipes],
+            many=True, context={'request': request}
+        )
+        results = serializer.data
+        for recipe in results:
+            recipe['matched_ingredients'] = matches[recipe['id']]
+        next_link = None
+        if len(found) > page * limit:
+            next_link = replace_query_param(
+                request.build_absolute_uri(), 'page', page + 1
+            )
+        return Response({'next': next_link, 'results': results})
+
+    @action(detail=False)
+    def popular(self, request):
+        """
+        Recipes most often added to favorites: for rolling week or, with
+        ?period=all, all-time. Size of the top is set by ?limit=.
+        """
+        period = request.query_params.get('period', WEEK)
+        if period not in PERIOD_FIELDS:
+            error_text = f'Period should be one of {", ".join(PERIOD_FIELDS)}.'
+            return Response(error_text, status=status.HTTP_400_BAD_REQUEST)
+
+        limit = CustomPageNumberPagination().get_page_size(request)
+        popularity = get_popular_recipes(period, limit)
+        serializer = FavoriteAndShoppingRecipeSerializer(
+            [row.recipe for row in popularity], many=True,
+            context={'request': request}
+        )
+        results = serializer.data
+        for recipe, row in zip(results, popularity):
+            recipe['favorites_count'] = getattr(row, PERIOD_FIELDS[period])
+        return Response(results)
+
+    @action(detail=True)
+    def similar(self, request, pk=None):
+        """
+        Recipes with similar ingredients, most similar first. Neighbours
+        are precomputed by build_similar_recipes command.
+        """
+        try:
+            recipes = Recipe.objects.filter(
+                similar_to__recipe_id=pk
+            ).order_by('-similar_to__score')
+        except ValueError:
+            raise Http404
+        serializer = FavoriteAndShoppingRecipeSerializer(
+            recipes, many=True, context={'request': request}
+        )
+        # Recipe is looked up only when it has no neighbours stored.
+        if not serializer.data and not Recipe.objects.filter(pk=pk).exists():
+            raise Http404
+        return Response(serializer.data)
+
+    @action(detail=False, permission_classes=(IsAuthorOrAdminOrDenied, ),
+            renderer_classes=(PDFRenderer, PlainTextRenderer,
+                              CSVRenderer, JSONRenderer))
     def download_shopping_cart(self, request):
-        current_user = request.user
-        return create_pdffile_response(user_id=current_user.id)
+        return create_shopping_list_response(
+            request, request.accepted_renderer.format
+        )
 
 
 class FavoriteViewSet(APIView):
@@ -55,23 +264,29 @@ class FavoriteViewSet(APIView):
     def get(self, request, pk=None):
         current_user = request.user
         recipe = get_object_or_404(Recipe, pk=pk)
-
-        if recipe.favorites.filter(user=current_user).exists():
+        favorite = Favorite(user=current_user, recipe=recipe)
+        with transaction.atomic():
+            created = insert_ignoring_conflicts([favorite], ('recipe',))
+            if created:
+                add_favorites_to_leaderboard([recipe.id], favorite.created)
+        if not created:
             error_text = "Recipe is already in user's favorites."
             return Response(error_text, status=status.HTTP_400_BAD_REQUEST)
-        Favorite.objects.create(user=current_user, recipe=recipe)
         serializer = FavoriteAndShoppingRecipeSerializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, pk=None):
         current_user = request.user
         recipe = get_object_or_404(Recipe, pk=pk)
-        try:
-            fav_recipe = recipe.favorites.get(user=current_user)
-        except models.Recipe.DoesNotExist:
+        with transaction.atomic():
+            deleted = delete_returning(
+                Favorite.objects.filter(user=current_user, recipe=recipe),
+                ('recipe', 'created')
+            )
+            remove_favorites_from_leaderboard(deleted)
+        if not deleted:
             error_text = 'Choosen recipe is not in favorites.'
             return Response(error_text, status=status.HTTP_400_BAD_REQUEST)
-        fav_recipe.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -81,23 +296,33 @@ class ShoppingCartViewSet(APIView):
     def get(self, request, pk=None):
         current_user = request.user
         recipe = get_object_or_404(Recipe, pk=pk)
-
-        if recipe.shopping_carts.filter(user=current_user).exists():
+        with transaction.atomic():
+            created = insert_ignoring_conflicts(
+                [ShoppingCart(user=current_user, recipe=recipe)], ('recipe',)
+            )
+            if created:
+                add_recipe_to_cart_totals(current_user.id, recipe.id)
+                count_shopping_carts([recipe.id], 1)
+        if not created:
             error_text = 'Recipe is already in shopping cart.'
             return Response(error_text, status=status.HTTP_400_BAD_REQUEST)
-        ShoppingCart.objects.create(user=current_user, recipe=recipe)
         serializer = FavoriteAndShoppingRecipeSerializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, pk=None):
         current_user = request.user
         recipe = get_object_or_404(Recipe, pk=pk)
-        try:
-            shopped_recipe = recipe.shopping_carts.get(user=current_user)
-        except models.Recipe.DoesNotExist:
+        with transaction.atomic():
+            deleted = delete_returning(
+                ShoppingCart.objects.filter(user=current_user, recipe=recipe),
+                ('recipe',)
+            )
+            if deleted:
+                remove_recipe_from_cart_totals(current_user.id, recipe.id)
+                count_shopping_carts([recipe.id], -1)
+        if not deleted:
             error_text = 'Choosen recipe is not in shopping cart.'
             return Response(error_text, status=status.HTTP_400_BAD_REQUEST)
-        shopped_recipe.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -117,11 +342,17 @@ class SubscriptionViewSet(APIView):
             error_text = 'You can not subscribe yourself.'
             return Response(error_text, status=status.HTTP_400_BAD_REQUEST)
 
-        if Follow.objects.filter(user=user, author=recipe_author).exists():
+        with transaction.atomic():
+            created = insert_ignoring_conflicts(
+                [Follow(user=user, author=recipe_author)], ('author',)
+            )
+            if created:
+                backfill_timeline(user.id, [recipe_author.id])
+                count_follows(user.id, [recipe_author.id], 1)
+        if not created:
             error_text = 'You are already subscribed to this author.'
             return Response(error_text, status=status.HTTP_400_BAD_REQUEST)
 
-        Follow.objects.create(user=user, author=recipe_author)
         serializer = CustomUserSubscribeSerializer(
             recipe_author,
             context={'request': request, 'recipes_limit': recipes_limit}
@@ -131,16 +362,167 @@ class SubscriptionViewSet(APIView):
     def delete(self, request, pk=None):
         follower = request.user
         recipe_author = get_object_or_404(CustomUser, pk=pk)
-        try:
-            subscription = follower.followers.get(author=recipe_author)
-        except models.Follow.DoesNotExist:
+        with transaction.atomic():
+            deleted = delete_returning(
+                Follow.objects.filter(user=follower, author=recipe_author),
+                ('author',)
+            )
+            if deleted:
+                remove_from_timeline(follower.id, [recipe_author.id])
+                count_follows(follower.id, [recipe_author.id], -1)
+        if not deleted:
             error_text = 'No subscription on given user found.'
             return Response(error_text,
                             status=status.HTTP_400_BAD_REQUEST)
-        subscription.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class BulkRelationView(APIView):
+    """
+    Adds (POST) or removes (DELETE) relations of request user to objects
+    with ids given as {"ids": [...]} in a few statements and responds
+    with outcome for every id. Relations are inserted ignoring conflicts
+    and deleted by one statement, both returning changed rows, so of
+    concurrent requests (single-id views work the same way) only the one
+    that changed a row reports and counts it, without locking the user.
+    """
+    permission_classes = (permissions.IsAuthenticated, )
+    model = None
+    field = None
+    target_model = None
+    # Fields of deleted relations passed to removed(), self.field first.
+    deleted_fields = None
+
+    def get_ids(self, request):
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return list(dict.fromkeys(serializer.validated_data['ids']))
+
+    def get_forbidden_ids(self, user):
+        return set()
+
+    def added(self, user, ids):
+        pass
+
+    def removed(self, user, rows):
+        """:param rows - deleted relations as tuples of deleted_fields."""
+        pass
+
+    def post(self, request):
+        ids = self.get_ids(request)
+        user = request.user
+        forbidden_ids = self.get_forbidden_ids(user)
+        with transaction.atomic():
+            found_ids = set(self.target_model.objects.filter(
+                id__in=ids
+            ).values_list('id', flat=True)) - forbidden_ids
+            created_ids = {pk for pk, in insert_ignoring_conflicts(
+                [self.model(user=user, **{f'{self.field}_id': pk})
+                 for pk in ids if pk in found_ids],
+                (self.field,)
+            )}
+            self.added(user, [pk for pk in ids if pk in created_ids])
+
+        results = []
+        for pk in ids:
+            if pk in forbidden_ids:
+                outcome = 'forbidden'
+            elif pk not in found_ids:
+                outcome = 'not_found'
+            elif pk not in created_ids:
+                outcome = 'already_exists'
+            else:
+                outcome = 'created'
+            results.append({'id': pk, 'status': outcome})
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
+    def delete(self, request):
+        ids = self.get_ids(request)
+        user = request.user
+        with transaction.atomic():
+            deleted = delete_returning(
+                self.model.objects.filter(
+                    user=user, **{f'{self.field}_id__in': ids}
+                ),
+                self.deleted_fields or (self.field,)
+            )
+            self.removed(user, deleted)
+
+        deleted_ids = {row[0] for row in deleted}
+        results = [
+            {'id': pk,
+             'status': 'deleted' if pk in deleted_ids else 'not_exists'}
+            for pk in ids
+        ]
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
+
+class BulkFavoriteView(BulkRelationView):
+    model = Favorite
+    field = 'recipe'
+    target_model = Recipe
+    deleted_fields = ('recipe', 'created')
+
+    def added(self, user, ids):
+        add_favorites_to_leaderboard(ids)
+
+    def removed(self, user, rows):
+        remove_favorites_from_leaderboard(rows)
+
+
+class BulkShoppingCartView(BulkRelationView):
+    model = ShoppingCart
+    field = 'recipe'
+    target_model = Recipe
+
+    def added(self, user, ids):
+        add_recipes_to_cart_totals(user.id, ids)
+        count_shopping_carts(ids, 1)
+
+    def removed(self, user, rows):
+        ids = [pk for pk, in rows]
+        remove_recipes_from_cart_totals(user.id, ids)
+        count_shopping_carts(ids, -1)
+
+
+class BulkSubscriptionView(BulkRelationView):
+    model = Follow
+    field = 'author'
+    target_model = CustomUser
+
+    def get_forbidden_ids(self, user):
+        return {user.id}
+
+    def added(self, user, ids):
+        backfill_timeline(user.id, ids)
+        count_follows(user.id, ids, 1)
+
+    def removed(self, user, rows):
+        ids = [pk for pk, in rows]
+        remove_from_timeline(user.id, ids)
+        count_follows(user.id, ids, -1)
+
+
+def get_subscriptions_queryset(user, recipes_limit=None):
+    """
+    Authors followed by user with their latest recipes prefetched by one
+    query: every recipe is taken only if it is among recipes_limit latest
+    recipes of its author, which is checked by correlated subquery with
+    LIMIT. So page of subscriptions costs constant number of queries.
+    :param user - follower.
+    :param recipes_limit - max number of recipes per author, all if None.
+    """
+    recipes = Recipe.objects.order_by('-id')
+    if recipes_limit is not None:
+        latest_recipes = Recipe.objects.filter(
+            author=models.OuterRef('author')
+        ).order_by('-id').values('id')[:max(recipes_limit, 0)]
+        recipes = recipes.filter(id__in=models.Subquery(latest_recipes))
+    return CustomUser.objects.filter(followings__user=user).annotate(
+        is_subscribed=models.Value(True, output_field=models.BooleanField())
+    ).prefetch_related(models.Prefetch('recipes', queryset=recipes))
+
+
 @api_view()
 @permission_classes([permissions.IsAuthenticated, ])
 def user_subscriptions(request):
@@ -151,7 +533,7 @@ def user_subscriptions(request):
         recipes_limit = None
 
     user = request.user
-    recipe_authors = CustomUser.objects.filter(followings__user=user)
+    recipe_authors = get_subscriptions_queryset(user, recipes_limit)
     paginator = CustomPagination()
     page = paginator.paginate_queryset(recipe_authors, request)
     if page is not None:
@@ -4,7 +4,8 @@ from .models import CustomUser
 
 
 class CustomUserAdmin(admin.ModelAdmin):
-    list_display = ('username', 'email',)
+    list_display = ('username', 'email', 'recipes_count', 'followers_count',
+                    'following_count',)
     list_filter = ('username', 'email',)
     empty_value_display = '-пусто-'
 
@@ -0,0 +1,156 @@
+import copy
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+
+from recipes_api.versions import AUTH_TOKENS, bump_version, get_version
+
+
+class TokenCache:
+    """
+    Process-local LRU cache of token key -> (user, token), entries expire
+    after `ttl` seconds. Entries are dropped when token is deleted or user
+    is saved, see users.signals. Other processes learn about it by version
+    of AUTH_TOKENS: it is checked at most once per `check_interval`
+    seconds and the whole cache is cleared when it changes.
+    """
+
+    def __init__(self, max_size: int, ttl: float, check_interval: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.entries = OrderedDict()
+        self.user_keys = defaultdict(set)
+        # Incremented by every invalidation: user read from database is
+        # not cached if token was invalidated while it was read.
+        self.generation = 0
+        self.version = None
+        self.checked_at = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def check_version(self) -> None:
+        now = time.monotonic()
+        if (self.checked_at is not None
+                and now - self.checked_at < self.check_interval):
+            return
+        version = get_version(AUTH_TOKENS)
+        with self.lock:
+            self.checked_at = now
+            if self.version != version:
+                self.clear()
+                self.version = version
+
+    def get(self, key: str):
+        """:return: copy of cached (user, token) or None."""
+        self.check_version()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[2] <= time.monotonic():
+                self.remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        # Requests get own copies: attributes set on request.user do not
+        # leak into other requests.
+        user = copy.copy(entry[0])
+        token = copy.copy(entry[1])
+        token.user = user
+        return user, token
+
+    def put(self, key: str, user, token, generation: int) -> None:
+        """
+        :param generation - value of self.generation before user was read.
+        """
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.remove(key)
+            self.entries[key] = (copy.copy(user), copy.copy(token),
+                                 time.monotonic() + self.ttl)
+            self.user_keys[user.pk].add(key)
+            while len(self.entries) > self.max_size:
+                self.remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def remove(self, key: str) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            keys = self.user_keys[entry[0].pk]
+            keys.discard(key)
+            if not keys:
+                del self.user_keys[entry[0].pk]
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.user_keys.clear()
+        self.generation += 1
+
+    def invalidate(self, key: str = None, user_id: int = None) -> None:
+        """Drops cached token or all tokens of user in this process."""
+        with self.lock:
+            if key is not None:
+                self.remove(key)
+            if user_id is not None:
+                for user_key in list(self.user_keys.get(user_id, ())):
+                    self.remove(user_key)
+            self.generation += 1
+            self.invalidations += 1
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None,
+                'expirations': self.expirations,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL,
+                         settings.TOKEN_CACHE_CHECK_INTERVAL)
+
+
+def invalidate_tokens(key: str = None, user_id: int = None) -> None:
+    """
+    Makes every process read token or tokens of user from database again.
+    Should be called inside transaction changing token or user: this
+    process drops them on commit, others on next version check.
+    """
+    bump_version(AUTH_TOKENS)
+    transaction.on_commit(lambda: token_cache.invalidate(key, user_id))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication reading token and user from TokenCache: cache
+    hit costs no queries. Inactive users and invalid tokens are not
+    cached.
+    """
+    cache = token_cache
+
+    def authenticate_credentials(self, key):
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        generation = self.cache.generation
+        user, token = super().authenticate_credentials(key)
+        self.cache.put(key, user, token, generation)
+        return user, token
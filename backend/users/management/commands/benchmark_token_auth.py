@@ -0,0 +1,65 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIRequestFactory
+
+from users.authentication import CachedTokenAuthentication, TokenCache
+
+
+class Command(BaseCommand):
+    help = ('Compares cached token authentication with stock DRF '
+            'TokenAuthentication on existing tokens. Tokens are requested '
+            'with Zipf distribution: a few users make most requests.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=10000)
+        parser.add_argument('--tokens', type=int, default=1000,
+                            help='Max number of existing tokens to use.')
+        parser.add_argument('--cache-size', type=int, default=None,
+                            help='Cache size, all used tokens by default.')
+        parser.add_argument('--ttl', type=float, default=300)
+
+    def measure(self, authentication, requests):
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            for request in requests:
+                authentication.authenticate(request)
+            elapsed = time.perf_counter() - started
+        return elapsed / len(requests), len(context.captured_queries)
+
+    def handle(self, *args, **options):
+        keys = list(Token.objects.filter(user__is_active=True).values_list(
+            'key', flat=True
+        )[:options['tokens']])
+        if not keys:
+            raise CommandError('No tokens of active users found.')
+
+        generator = random.Random(0)
+        weights = [1 / rank for rank in range(1, len(keys) + 1)]
+        factory = APIRequestFactory()
+        requests = [
+            factory.get('/api/recipes/', HTTP_AUTHORIZATION=f'Token {key}')
+            for key in generator.choices(keys, weights,
+                                         k=options['requests'])
+        ]
+
+        cached = CachedTokenAuthentication()
+        cached.cache = TokenCache(options['cache_size'] or len(keys),
+                                  options['ttl'], check_interval=1)
+        for label, authentication in (('stock', TokenAuthentication()),
+                                      ('cached', cached)):
+            elapsed, queries = self.measure(authentication, requests)
+            self.stdout.write(
+                f'{label:>7}: {elapsed * 1000:7.3f} ms per request, '
+                f'{queries} queries for {len(requests)} requests'
+            )
+        stats = cached.cache.get_stats()
+        self.stdout.write(
+            f'cache: {len(keys)} tokens, hit rate {stats["hit_rate"]:.1%}, '
+            f'{stats["evictions"]} evictions'
+        )
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.19 on 2026-10-18 01:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='fan_out_on_read',
+            field=models.BooleanField(default=False, help_text='Рецепты автора не рассылаются в ленты подписчиков, а читаются из таблицы рецептов.', verbose_name='лента подписчиков при чтении'),
+        ),
+    ]
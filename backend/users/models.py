@@ -13,6 +13,18 @@ class CustomUser(AbstractUser):
     last_name = models.CharField('фамилия', max_length=150)
     is_staff = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
+    fan_out_on_read = models.BooleanField(
+        'лента подписчиков при чтении', default=False,
+        help_text='Рецепты автора не рассылаются в ленты подписчиков, '
+                  'а читаются из таблицы рецептов.'
+    )
+    # Denormalized counters, see recipes_api.counters.
+    recipes_count = models.IntegerField('рецептов', default=0,
+                                        editable=False)
+    followers_count = models.IntegerField('подписчиков', default=0,
+                                          editable=False)
+    following_count = models.IntegerField('подписок', default=0,
+                                          editable=False)
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
 
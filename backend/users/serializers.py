@@ -17,6 +17,8 @@ class CustomUserSerializer(UserSerializer):
         current_user = self.context.get('request').user
         if current_user.is_anonymous:
             return False
+        if hasattr(author, 'is_subscribed'):
+            return (current_user == author) or author.is_subscribed
         return (current_user == author) or Follow.objects.filter(
             user=current_user, author=author
         ).exists()
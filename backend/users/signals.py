@@ -0,0 +1,22 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_tokens
+from .models import CustomUser
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    invalidate_tokens(key=instance.key)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def user_changed(sender, instance, created=False, update_fields=None,
+                 **kwargs):
+    # New user has no tokens yet, login only updates last_login: neither
+    # is worth clearing caches of all processes.
+    if created or update_fields and set(update_fields) == {'last_login'}:
+        return
+    invalidate_tokens(user_id=instance.pk)
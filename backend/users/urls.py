@@ -1,12 +1,13 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import CustomUserModelViewSet
+from .views import CustomUserModelViewSet, token_cache_stats
 
 v1_router = DefaultRouter()
 v1_router.register('users', CustomUserModelViewSet)
 
 urlpatterns = [
     path('', include(v1_router.urls)),
+    path('auth/token_cache/', token_cache_stats),
     path('auth/', include('djoser.urls.authtoken')),
 ]
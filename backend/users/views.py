@@ -1,5 +1,9 @@
 from djoser.views import UserViewSet
+from rest_framework import permissions
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
 
+from .authentication import token_cache
 from .models import CustomUser
 from .permissions import IsOwnerOrAuthenticatedOrCreateOnly
 from .serializers import CustomUserSerializer
@@ -9,3 +13,10 @@ class CustomUserModelViewSet(UserViewSet):
     queryset = CustomUser.objects.all()
     serializer_class = CustomUserSerializer
     permission_classes = (IsOwnerOrAuthenticatedOrCreateOnly, )
+
+
+@api_view()
+@permission_classes([permissions.IsAdminUser, ])
+def token_cache_stats(request):
+    """Token cache counters of the process that served the request."""
+    return Response(token_cache.get_stats())